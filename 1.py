@@ -1,9 +1,15 @@
 # save_rendered.py
 # Usage: python save_rendered.py "https://example.com/page" out_dir
 import sys, os, time, json, pathlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin, urlparse
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import sync_playwright, Error as PlaywrightError
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+ASSET_WORKERS = 16
+SETTLE_MAX_MS = 1500
 
 def ensure_dir(p: pathlib.Path):
     p.mkdir(parents=True, exist_ok=True)
@@ -34,22 +40,37 @@ def main(url, out_dir):
               }
             })()
         """)
-        page.wait_for_timeout(1500)
+        # Settle once lazy images have finished, rather than a fixed 1.5s
+        try:
+            page.wait_for_function(
+                "() => Array.from(document.images).every(img => img.complete)",
+                timeout=SETTLE_MAX_MS,
+            )
+        except PlaywrightError:
+            pass  # cap reached; capture what is there
+
+        # Capture rendered HTML and asset URLs in one round-trip
+        result = page.evaluate("""
+            () => ({
+              html: (document.doctype ? new XMLSerializer().serializeToString(document.doctype) : "")
+                    + document.documentElement.outerHTML,
+              assets: Array.from(
+                document.querySelectorAll("img[src], script[src], link[rel='stylesheet'][href]"),
+                e => e.getAttribute(e.tagName === "LINK" ? "href" : "src")
+              ),
+            })
+        """)
 
         # Save rendered HTML
-        html = page.content()
+        html = result["html"]
         html_path = out_dir / "page_rendered.html"
         html_path.write_text(html, encoding="utf-8")
 
-        # Collect asset URLs from DOM
+        raw_urls = result["assets"]
         asset_urls = set()
-        for selector, attr in [("img", "src"), ("script", "src"), ("link[rel='stylesheet']", "href")]:
-            elements = page.locator(selector)
-            count = elements.count()
-            for i in range(count):
-                value = elements.nth(i).get_attribute(attr)
-                if value and not value.startswith("data:") and not value.startswith("#"):
-                    asset_urls.add(urljoin(url, value))
+        for value in raw_urls:
+            if value and not value.startswith("data:") and not value.startswith("#"):
+                asset_urls.add(urljoin(url, value))
 
         # Reuse cookies to fetch assets (helps with gated CDNs)
         cookies = ctx.cookies()
@@ -60,24 +81,37 @@ def main(url, out_dir):
             "Cookie": cookie_header,
             "Referer": url
         })
+        # Pool keep-alive sockets across the worker threads
+        adapter = HTTPAdapter(pool_connections=ASSET_WORKERS, pool_maxsize=ASSET_WORKERS,
+                              max_retries=Retry(total=2, backoff_factor=0.3))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        def fetch(aurl):
+            r = session.get(aurl, timeout=30)
+            r.raise_for_status()
+            return aurl, r.content
 
         assets_dir = out_dir / "assets"
         ensure_dir(assets_dir)
         downloaded = 0
-        for aurl in asset_urls:
-            try:
-                r = session.get(aurl, timeout=30)
-                r.raise_for_status()
-                parsed = urlparse(aurl)
-                name = parsed.path.strip("/").replace("/", "_")
-                if not name:
-                    name = "index"
-                ext = os.path.splitext(parsed.path)[1] or ""
-                local = assets_dir / f"{name}{ext}"
-                local.write_bytes(r.content)
-                downloaded += 1
-            except Exception as e:
-                print(f"[warn] asset failed: {aurl} ({e})")
+        with ThreadPoolExecutor(max_workers=ASSET_WORKERS) as ex:
+            futures = {ex.submit(fetch, u): u for u in asset_urls}
+            for fut in as_completed(futures):
+                aurl = futures[fut]
+                try:
+                    _, content = fut.result()
+                    parsed = urlparse(aurl)
+                    name = parsed.path.strip("/").replace("/", "_")
+                    if not name:
+                        name = "index"
+                    ext = os.path.splitext(parsed.path)[1] or ""
+                    local = assets_dir / f"{name}{ext}"
+                    # Writes stay on the main thread
+                    local.write_bytes(content)
+                    downloaded += 1
+                except Exception as e:
+                    print(f"[warn] asset failed: {aurl} ({e})")
 
         print(f"[done] HTML: {html_path}")
         print(f"[done] Assets: {downloaded} saved in {assets_dir}")
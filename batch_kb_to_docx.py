@@ -1,68 +1,47 @@
 #!/usr/bin/env python3
 import argparse
 import base64
+import queue
 import re
 import shutil
+import threading
 import time
-import tempfile
+from collections import OrderedDict, deque
 from io import BytesIO
 from pathlib import Path
-from datetime import datetime
-from urllib.parse import unquote, urljoin, urlparse
+from urllib.parse import urljoin, urlparse
 
 import pandas as pd
-from bs4 import BeautifulSoup, Tag, NavigableString
+from openpyxl import load_workbook
+from bs4 import BeautifulSoup, Tag
 from docx import Document
 from docx.shared import Inches, Pt
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 from playwright._impl._errors import Error as PlaywrightError
 
+from kb_common import decode_target_to_direct_url, extract_kb_number, looks_like_login, safe_filename, stamp
 
-# -------------------------
-# Helpers
-# -------------------------
-
-def stamp() -> str:
-    return datetime.now().strftime("%Y%m%d_%H%M%S")
-
-
-def safe_filename(name: str, default: str = "file") -> str:
-    name = (name or "").strip() or default
-    name = re.sub(r"[^\w\-\.]+", "_", name)
-    return name[:180]
-
+# Optional: selectolax parses/selects ~10x faster than BS4 for container picking
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
 
-def looks_like_login(url: str) -> bool:
-    u = (url or "").lower()
-    return any(s in u for s in (
-        "login", "sso", "saml", "auth", "okta", "adfs", "signin", "microsoftonline.com"
-    ))
+# Otherwise plain lxml (nodes stay in C) if cssselect is available
+try:
+    import lxml.html
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    CSSSelector = None
 
 
-def extract_kb_number(text: str) -> str | None:
-    m = re.search(r"(KB\d+)", text or "")
-    return m.group(1) if m else None
+# -------------------------
+# Helpers
+# -------------------------
 
-
-def decode_target_to_direct_url(url: str) -> str:
-    """
-    Converts:
-      .../target/kb_view.do%3Fsysparm_article%3DKB0010611
-    into:
-      https://<host>/kb_view.do?sysparm_article=KB0010611
-    """
-    m = re.search(r"/target/([^?]+)", url)
-    if not m:
-        return url
-    encoded = m.group(1)
-    decoded = unquote(encoded)
-    if decoded.startswith("http://") or decoded.startswith("https://"):
-        return decoded
-    host = re.match(r"^(https?://[^/]+)", url)
-    if not host:
-        return url
-    return f"{host.group(1)}/{decoded.lstrip('/')}"
+_RE_WS = re.compile(r"\s+")
+_RE_DATAIMG = re.compile(r"data:image/([^;]+);base64", re.IGNORECASE)
 
 
 def attach_debug(page, verbose: bool = False):
@@ -73,6 +52,24 @@ def attach_debug(page, verbose: bool = False):
     page.on("requestfailed", lambda req: print(f"[requestfailed] {req.url} -> {req.failure}"))
 
 
+# Fonts, media and trackers; the article HTML is all we render for and images
+# are fetched separately. Matched by URL because Playwright routing would turn
+# off the HTTP cache and re-download ServiceNow's JS/CSS bundles for every KB.
+# The trailing * keeps matching when a ?v= cache-buster follows the extension.
+BLOCKED_URL_PATTERNS = [
+    "*.woff*", "*.ttf*", "*.otf*", "*.eot*",
+    "*.mp4*", "*.webm*", "*.mp3*", "*.m4a*",
+    "*doubleclick*", "*googletagmanager*", "*google-analytics*", "*segment.io*",
+]
+
+
+def block_nonessential(page) -> None:
+    """Block through CDP Network.setBlockedURLs so the browser cache stays on."""
+    cdp = page.context.new_cdp_session(page)
+    cdp.send("Network.enable")
+    cdp.send("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+
+
 def get_body_text(page) -> str:
     try:
         return page.evaluate("() => (document.body && document.body.innerText || '').trim()")
@@ -81,15 +78,39 @@ def get_body_text(page) -> str:
 
 
 def wait_for_text_length(page, min_chars: int, timeout_ms: int) -> int:
-    deadline = time.time() + timeout_ms / 1000
-    last_len = 0
-    while time.time() < deadline:
-        txt = get_body_text(page)
-        last_len = len(txt)
-        if last_len >= min_chars:
-            return last_len
-        time.sleep(0.25)
-    return last_len
+    # Predicate is polled inside the browser; one round-trip instead of one per 250ms.
+    # Same 250ms cadence: the default rAF polling would force innerText's layout every frame
+    try:
+        page.wait_for_function(
+            "n => (document.body && document.body.innerText || '').trim().length >= n",
+            arg=min_chars,
+            polling=250,
+            timeout=timeout_ms,
+        )
+    except PlaywrightError:
+        # Timeout, or the context was torn down by a late redirect
+        pass
+    return len(get_body_text(page))
+
+
+def probe_static_html(context, url: str, timeout_ms: int, min_chars: int) -> tuple[str, str] | None:
+    """
+    GET the page over context.request (browser cookies + TLS session, no
+    renderer). Returns (html, final_url), or None if it bounced to SSO or
+    doesn't look like an HTML page.
+    """
+    try:
+        resp = context.request.get(url, timeout=timeout_ms)
+        if not resp.ok or looks_like_login(resp.url):
+            return None
+        if "html" not in (resp.headers.get("content-type") or "").lower():
+            return None
+        body = resp.text()
+    except Exception:
+        return None
+    if len(body) < min_chars:
+        return None
+    return body, resp.url
 
 
 def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attempts: int = 3) -> None:
@@ -133,50 +154,149 @@ USELESS_SELECTORS = [
     ".navbar", ".nav", ".navigation", ".header", ".footer",
     ".sidebar", ".side-nav", ".toc", ".breadcrumbs",
 ]
+CANDIDATE_SELECTORS = [
+    "article", "main",
+    "#kb_article", ".kb-article", ".kb-article-content", ".kb-view",
+    ".sn-kb-article", ".knowledge-article",
+    "[id*='kb']", "[class*='kb']",
+    "[class*='article']", "[class*='content']",
+]
+
+# Parse each selector list once and match in a single tree walk
+_USELESS_COMPOUND = ", ".join(sorted(USELESS_TAGS) + USELESS_SELECTORS)
+_CANDIDATE_COMPOUND = ", ".join(CANDIDATE_SELECTORS)
+_USELESS_LXML = CSSSelector(_USELESS_COMPOUND) if CSSSelector else None
+_CANDIDATE_LXML = CSSSelector(_CANDIDATE_COMPOUND) if CSSSelector else None
+_FALLBACK_LXML = CSSSelector("div, section, article, main") if CSSSelector else None
 
 
 def soup_remove_useless(soup: BeautifulSoup) -> None:
-    for t in list(soup.find_all(list(USELESS_TAGS))):
+    for t in soup.select(_USELESS_COMPOUND):
         t.decompose()
-    for sel in USELESS_SELECTORS:
-        for t in soup.select(sel):
-            t.decompose()
 
 
-def pick_best_container(soup: BeautifulSoup) -> Tag:
-    candidate_selectors = [
-        "article", "main",
-        "#kb_article", ".kb-article", ".kb-article-content", ".kb-view",
-        ".sn-kb-article", ".knowledge-article",
-        "[id*='kb']", "[class*='kb']",
-        "[class*='article']", "[class*='content']",
-    ]
+def pick_best_container(soup: BeautifulSoup, min_chars: int = 400) -> Tag:
+    best_node = None
+    best_len = 0
+
+    # Candidate sets overlap heavily; measure each node's text only once
+    text_len_cache: dict[int, int] = {}
+
+    def tlen(node: Tag) -> int:
+        k = id(node)
+        v = text_len_cache.get(k)
+        if v is None:
+            v = text_len_cache[k] = len(node.get_text("\n", strip=True))
+        return v
+
+    for node in soup.select(_CANDIDATE_COMPOUND):
+        ln = tlen(node)
+        if ln > best_len:
+            best_len = ln
+            best_node = node
+
+    if best_node and best_len >= min_chars:
+        return best_node
+
+    # Stop once a block is comfortably big enough; the rest of the scan
+    # would only re-walk subtrees with get_text
+    for node in soup.descendants:
+        if not isinstance(node, Tag) or node.name not in ("div", "section", "article", "main"):
+            continue
+        ln = tlen(node)
+        if ln > best_len:
+            best_len = ln
+            best_node = node
+            if best_len >= 8 * min_chars:
+                break
+
+    return best_node if best_node else (soup.body or soup)
+
+
+def _extract_main_container_fast(html: str) -> tuple[str, Tag]:
+    """
+    Same heuristics as the BS4 path, but parse/clean/select in selectolax (C)
+    and only hand the winning subtree to BS4 for the DOCX walker.
+    """
+    tree = HTMLParser(html)
+    title_node = tree.css_first("title")
+    title = title_node.text(strip=True) if title_node else ""
+
+    # Reverse document order: descendants go before their ancestors are freed
+    for t in reversed(tree.css(_USELESS_COMPOUND)):
+        t.decompose()
 
     best_node = None
     best_len = 0
 
-    for sel in candidate_selectors:
-        for node in soup.select(sel):
-            txt = node.get_text("\n", strip=True)
-            ln = len(txt)
+    for node in tree.css(_CANDIDATE_COMPOUND):
+        ln = len(node.text(deep=True, separator="\n", strip=True))
+        if ln > best_len:
+            best_len = ln
+            best_node = node
+
+    if not (best_node and best_len >= 400):
+        for node in tree.css("div, section, article, main"):
+            ln = len(node.text(deep=True, separator="\n", strip=True))
             if ln > best_len:
                 best_len = ln
                 best_node = node
 
-    if best_node and best_len >= 400:
-        return best_node
+    best_node = best_node or tree.body
+    if best_node is None:
+        soup = BeautifulSoup(html, "lxml")
+        return title, soup.body or soup
+
+    soup = BeautifulSoup(best_node.html, "lxml")
+    return title, soup.body or soup
+
+
+def _extract_main_container_lxml(html: str) -> tuple[str, Tag]:
+    """
+    lxml.html variant of the same heuristics; text_content() is C-level,
+    and only the winning subtree is converted to BS4.
+    """
+    root = lxml.html.fromstring(html)
+    title = (root.findtext(".//title") or "").strip()
+
+    for el in _USELESS_LXML(root):
+        if el.getparent() is not None:
+            el.drop_tree()
 
-    for node in soup.find_all(["div", "section", "article", "main"], recursive=True):
-        txt = node.get_text("\n", strip=True)
-        ln = len(txt)
+    def tlen(el) -> int:
+        return len(" ".join(el.text_content().split()))
+
+    best_node = None
+    best_len = 0
+
+    for el in _CANDIDATE_LXML(root):
+        ln = tlen(el)
         if ln > best_len:
             best_len = ln
-            best_node = node
+            best_node = el
 
-    return best_node if best_node else (soup.body or soup)
+    if not (best_node is not None and best_len >= 400):
+        for el in _FALLBACK_LXML(root):
+            ln = tlen(el)
+            if ln > best_len:
+                best_len = ln
+                best_node = el
+
+    if best_node is None:
+        best_node = root.find("body")
+        if best_node is None:
+            best_node = root
+
+    soup = BeautifulSoup(lxml.html.tostring(best_node, encoding="unicode"), "lxml")
+    return title, soup.body or soup
 
 
 def extract_main_container(html: str) -> tuple[str, Tag]:
+    if HTMLParser is not None:
+        return _extract_main_container_fast(html)
+    if CSSSelector is not None:
+        return _extract_main_container_lxml(html)
+
     soup = BeautifulSoup(html, "lxml")
     title = soup.title.get_text(strip=True) if soup.title else ""
     soup_remove_useless(soup)
@@ -188,13 +308,48 @@ def extract_main_container(html: str) -> tuple[str, Tag]:
 # Images (auth-aware via context.request)
 # -------------------------
 
+# Shared across the whole batch: logos/icons repeat in every KB. Keyed by
+# absolute URL and bounded by total bytes (least recently used goes first),
+# so a long Excel run doesn't hold every image it ever saw. Worker threads
+# share it, hence the lock.
+IMG_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_IMG_CACHE: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+_IMG_CACHE_BYTES = 0
+_IMG_CACHE_LOCK = threading.Lock()
+
+
+def img_cache_get(key: str) -> tuple[bytes, str] | None:
+    with _IMG_CACHE_LOCK:
+        item = _IMG_CACHE.get(key)
+        if item is not None:
+            _IMG_CACHE.move_to_end(key)
+        return item
+
+
+def img_cache_put(key: str, item: tuple[bytes, str]) -> tuple[bytes, str]:
+    global _IMG_CACHE_BYTES
+    size = len(item[0])
+    if size > IMG_CACHE_MAX_BYTES // 8:
+        return item  # one huge diagram shouldn't flush all the icons
+    with _IMG_CACHE_LOCK:
+        old = _IMG_CACHE.pop(key, None)
+        if old is not None:
+            _IMG_CACHE_BYTES -= len(old[0])
+        _IMG_CACHE[key] = item
+        _IMG_CACHE_BYTES += size
+        while _IMG_CACHE_BYTES > IMG_CACHE_MAX_BYTES:
+            _, (bts, _) = _IMG_CACHE.popitem(last=False)
+            _IMG_CACHE_BYTES -= len(bts)
+    return item
+
+
 def is_data_image(src: str) -> bool:
     return src.startswith("data:image/")
 
 
 def decode_data_image(src: str) -> tuple[bytes, str]:
     header, b64 = src.split(",", 1)
-    m = re.search(r"data:image/([^;]+);base64", header, re.IGNORECASE)
+    m = _RE_DATAIMG.search(header)
     ext = (m.group(1).lower() if m else "png").replace("jpeg", "jpg")
     return base64.b64decode(b64), ext
 
@@ -218,6 +373,18 @@ def guess_ext_from_content_type(ct: str | None) -> str:
     return "png"
 
 
+# Base64 in native code (FileReader data: URL) instead of a per-byte
+# String.fromCharCode loop, which crawls on multi-MB images
+BLOB_B64_JS = """
+    const blobB64 = (blob) => new Promise((resolve, reject) => {
+        const fr = new FileReader();
+        fr.onload = () => resolve(fr.result.slice(fr.result.indexOf(',') + 1));
+        fr.onerror = () => reject(fr.error);
+        fr.readAsDataURL(blob);
+    });
+"""
+
+
 def fetch_image_bytes(page, context, src: str, base_url: str) -> tuple[bytes | None, str | None]:
     if not src:
         return None, None
@@ -226,21 +393,14 @@ def fetch_image_bytes(page, context, src: str, base_url: str) -> tuple[bytes | N
 
     # data: image
     if is_data_image(src):
-        bts, ext = decode_data_image(src)
-        return bts, ext
+        # Not cached: hashing the whole URI for a key costs about as much as decoding it
+        return decode_data_image(src)
 
     # blob: image -> fetch within page
     if src.startswith("blob:"):
         try:
             b64 = page.evaluate(
-                """async (u) => {
-                    const r = await fetch(u);
-                    const b = await r.blob();
-                    const a = new Uint8Array(await b.arrayBuffer());
-                    let s = '';
-                    for (let i=0; i<a.length; i++) s += String.fromCharCode(a[i]);
-                    return btoa(s);
-                }""",
+                "async (u) => {" + BLOB_B64_JS + " return blobB64(await (await fetch(u)).blob()); }",
                 src
             )
             return base64.b64decode(b64), "png"
@@ -252,21 +412,231 @@ def fetch_image_bytes(page, context, src: str, base_url: str) -> tuple[bytes | N
     if scheme not in ("http", "https"):
         return None, None
 
+    cached = img_cache_get(full_url)
+    if cached is not None:
+        return cached
+
     try:
         resp = context.request.get(full_url, timeout=60_000)
         if not resp.ok:
             return None, None
         ext = guess_ext_from_content_type(resp.headers.get("content-type"))
-        return resp.body(), ext
+        return img_cache_put(full_url, (resp.body(), ext))
     except Exception:
         return None, None
 
 
+PREFETCH_IMAGES_JS = """async (urls) => {""" + BLOB_B64_JS + """
+    const one = async (u) => {
+        try {
+            const r = await fetch(u, {credentials: 'include'});
+            if (!r.ok) return null;
+            return [await blobB64(await r.blob()), r.headers.get('content-type')];
+        } catch (e) {
+            return null;
+        }
+    };
+    return Promise.all(urls.map(one));
+}"""
+
+
+def same_origin(a: str, b: str) -> bool:
+    pa, pb = urlparse(a), urlparse(b)
+    return (pa.scheme, pa.netloc) == (pb.scheme, pb.netloc)
+
+
+def prefetch_images(page, context, srcs, base_url: str) -> dict:
+    """
+    Fetch all unique image srcs up front instead of one RTT per <img>.
+    Sync Playwright objects can't be shared across threads, so the parallel
+    part runs in-page (Promise.all); anything it can't get (CORS, data:,
+    blob:, errors) falls back to fetch_image_bytes one at a time.
+    """
+    results = {}
+    remote = {}
+    for src in srcs:
+        s = (src or "").strip()
+        if not s or is_data_image(s) or s.startswith("blob:"):
+            continue
+        full_url = urljoin(base_url, s)
+        cached = img_cache_get(full_url)
+        if cached is not None:
+            results[src] = cached
+        elif urlparse(full_url).scheme.lower() in ("http", "https"):
+            remote[src] = full_url
+
+    # In-page fetch only works from the KB's own origin: on about:blank (fresh
+    # worker pages) or the static-probe path every credentialed fetch fails CORS
+    if remote and same_origin(page.url, base_url):
+        try:
+            fetched = page.evaluate(PREFETCH_IMAGES_JS, list(remote.values()))
+        except Exception:
+            fetched = []
+        for (src, full_url), item in zip(remote.items(), fetched):
+            if item:
+                b64, ct = item
+                results[src] = img_cache_put(full_url, (base64.b64decode(b64), guess_ext_from_content_type(ct)))
+
+    for src in srcs:
+        if src not in results:
+            results[src] = fetch_image_bytes(page, context, src, base_url=base_url)
+    return results
+
+
 # -------------------------
 # HTML -> DOCX (structure + images)
 # -------------------------
 
-def build_docx(title: str, source_url: str, container: Tag, page, context,
+JS_EXTRACTOR = """(cfg) => {
+    const textLen = (n) => (n.innerText || '').trim().length;
+    // Same as BS4's get_text(sep, strip=True): stripped text nodes joined by
+    // sep, so <br> and cell boundaries don't glue words together
+    const clean = (n, sep) => {
+        const parts = [];
+        const w = document.createTreeWalker(n, NodeFilter.SHOW_TEXT);
+        for (let t = w.nextNode(); t; t = w.nextNode()) {
+            if (t.parentElement.closest('script, style, noscript')) continue;
+            const s = t.data.trim();
+            if (s) parts.push(s);
+        }
+        return parts.join(sep);
+    };
+
+    let best = null, bestLen = 0;
+    for (const n of document.querySelectorAll(cfg.candidates)) {
+        if (n.closest(cfg.useless)) continue;
+        const l = textLen(n);
+        if (l > bestLen) { bestLen = l; best = n; }
+    }
+    if (!(best && bestLen >= 400)) {
+        for (const n of document.querySelectorAll('div, section, article, main')) {
+            if (n.closest(cfg.useless)) continue;
+            const l = textLen(n);
+            if (l > bestLen) { bestLen = l; best = n; }
+        }
+    }
+    best = best || document.body;
+
+    const blocks = [];
+    const img = (e) => {
+        const raw = e.getAttribute('src') || e.getAttribute('data-src') || '';
+        let src = raw;
+        try { if (raw) src = new URL(raw, location.href).href; } catch (err) {}
+        blocks.push({type: 'img', src: src, alt: e.getAttribute('alt') || ''});
+    };
+    const imgsIn = (e) => e.querySelectorAll('img').forEach(img);
+    const walk = (n) => {
+        if (n.matches(cfg.useless)) return;
+        const name = n.tagName.toLowerCase();
+        if (/^h[1-6]$/.test(name)) {
+            blocks.push({type: 'heading', level: Math.min(4, +name[1]), text: clean(n, ' ')});
+        } else if (name === 'p' || name === 'table') {
+            blocks.push({type: 'p', text: clean(n, name === 'table' ? '\\n' : ' ')});
+            imgsIn(n);
+        } else if (name === 'ul' || name === 'ol') {
+            for (const li of n.children) {
+                if (li.tagName !== 'LI') continue;
+                blocks.push({type: 'li', ordered: name === 'ol', text: clean(li, ' ')});
+                imgsIn(li);
+            }
+        } else if (name === 'img') {
+            img(n);
+        } else {
+            for (const c of n.children) walk(c);
+        }
+    };
+    if (best) for (const c of best.children) walk(c);
+    return {title: document.title || '', blocks: blocks};
+}"""
+
+
+def extract_blocks(page) -> tuple[str, list[dict]]:
+    """
+    Pick the main container and flatten it to ordered blocks inside the page,
+    so only a small JSON payload crosses CDP (no page.content() + reparse).
+    """
+    res = page.evaluate(JS_EXTRACTOR, {
+        "useless": _USELESS_COMPOUND,
+        "candidates": _CANDIDATE_COMPOUND,
+    })
+    return res.get("title") or "", res.get("blocks") or []
+
+
+def stripped_page_content(page) -> str:
+    """
+    page.content() after dropping chrome (scripts, nav, header, ...) in the
+    browser, so less HTML is serialized over CDP and parsed by lxml.
+    """
+    try:
+        page.evaluate("(sel) => document.querySelectorAll(sel).forEach(n => n.remove())",
+                      _USELESS_COMPOUND)
+    except Exception:
+        pass
+    return page.content()
+
+
+def container_to_blocks(container: Tag) -> list[dict]:
+    """
+    BS4 fallback producing the same block list as JS_EXTRACTOR.
+    """
+    blocks = []
+
+    def add_img(img_tag: Tag):
+        blocks.append({
+            "type": "img",
+            "src": img_tag.get("src") or img_tag.get("data-src") or "",
+            "alt": img_tag.get("alt") or "",
+        })
+
+    # Explicit stack instead of recursion: deep ServiceNow wrappers nest 30+ levels
+    stack = deque(container.children)
+    while stack:
+        node = stack.popleft()
+        if not isinstance(node, Tag):
+            continue
+
+        name = (node.name or "").lower()
+
+        if name in ("script", "style", "noscript"):
+            continue
+
+        if name in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            level = min(4, int(name[1]))
+            blocks.append({"type": "heading", "level": level, "text": node.get_text(" ", strip=True)})
+            continue
+
+        if name == "p":
+            blocks.append({"type": "p", "text": node.get_text(" ", strip=True)})
+            for img in node.find_all("img"):
+                add_img(img)
+            continue
+
+        if name in ("ul", "ol"):
+            ordered = (name == "ol")
+            for li in node.find_all("li", recursive=False):
+                blocks.append({"type": "li", "ordered": ordered, "text": li.get_text(" ", strip=True)})
+                for img in li.find_all("img"):
+                    add_img(img)
+            continue
+
+        if name == "img":
+            add_img(node)
+            continue
+
+        if name == "table":
+            # Simple fallback: table to text
+            blocks.append({"type": "p", "text": node.get_text("\n", strip=True)})
+            for img in node.find_all("img"):
+                add_img(img)
+            continue
+
+        # default: visit direct children next, in document order
+        stack.extendleft(reversed(list(node.children)))
+
+    return blocks
+
+
+def build_docx(title: str, source_url: str, blocks: list[dict], page, context,
                output_path: Path, max_image_width_in: float = 6.0):
     doc = Document()
 
@@ -278,155 +648,235 @@ def build_docx(title: str, source_url: str, container: Tag, page, context,
     doc.add_paragraph(f"Source: {source_url}")
     doc.add_paragraph("")
 
-    temp_dir = Path(tempfile.mkdtemp(prefix="kb_docx_imgs_"))
-    img_counter = 0
-
     def add_text_paragraph(text: str):
-        text = re.sub(r"\s+", " ", (text or "")).strip()
+        text = _RE_WS.sub(" ", (text or "")).strip()
         if text:
             doc.add_paragraph(text)
 
     def add_heading(text: str, level: int):
-        text = re.sub(r"\s+", " ", (text or "")).strip()
+        text = _RE_WS.sub(" ", (text or "")).strip()
         if text:
             doc.add_heading(text, level=level)
 
     def add_list_item(text: str, ordered: bool):
-        text = re.sub(r"\s+", " ", (text or "")).strip()
+        text = _RE_WS.sub(" ", (text or "")).strip()
         if not text:
             return
         doc.add_paragraph(text, style=("List Number" if ordered else "List Bullet"))
 
-    def handle_img(img_tag: Tag):
-        nonlocal img_counter
-        src = img_tag.get("src") or img_tag.get("data-src") or ""
-        alt = img_tag.get("alt") or ""
+    def handle_img(block: dict):
+        src = block.get("src") or ""
+        alt = block.get("alt") or ""
 
-        bts, ext = fetch_image_bytes(page, context, src, base_url=source_url)
+        bts, ext = images.get(src) or fetch_image_bytes(page, context, src, base_url=source_url)
         if not bts:
             # If it fails, add a note so you know something was there
             doc.add_paragraph(f"[Image not downloaded]{(': ' + alt) if alt else ''}")
             return
 
-        img_counter += 1
-        img_path = temp_dir / f"img_{img_counter}.{ext}"
-        img_path.write_bytes(bts)
-
         if alt:
             doc.add_paragraph(alt)
 
         try:
-            doc.add_picture(str(img_path), width=Inches(max_image_width_in))
+            # python-docx takes a file-like object; no temp file round trip
+            doc.add_picture(BytesIO(bts), width=Inches(max_image_width_in))
         except Exception:
             # Word/python-docx may not support webp etc.
             doc.add_paragraph(f"[Image format not supported in Word: .{ext}]")
 
-    def walk(node: Tag):
-        if isinstance(node, NavigableString):
-            return
-        if not isinstance(node, Tag):
-            return
+    srcs = {b.get("src") or "" for b in blocks if b["type"] == "img"}
+    images = prefetch_images(page, context, srcs, base_url=source_url)
 
-        name = (node.name or "").lower()
+    for b in blocks:
+        kind = b["type"]
+        if kind == "heading":
+            add_heading(b.get("text"), level=b.get("level", 2))
+        elif kind == "p":
+            add_text_paragraph(b.get("text"))
+        elif kind == "li":
+            add_list_item(b.get("text"), ordered=b.get("ordered", False))
+        elif kind == "img":
+            handle_img(b)
 
-        if name in ("script", "style", "noscript"):
-            return
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(str(output_path))
 
-        if name in ("h1", "h2", "h3", "h4", "h5", "h6"):
-            level = min(4, int(name[1]))
-            add_heading(node.get_text(" ", strip=True), level=level)
-            return
 
-        if name == "p":
-            txt = node.get_text(" ", strip=True)
-            if txt:
-                add_text_paragraph(txt)
-            for img in node.find_all("img"):
-                handle_img(img)
-            return
+# -------------------------
+# Batch: Excel reading + crawling loop
+# -------------------------
 
-        if name in ("ul", "ol"):
-            ordered = (name == "ol")
-            for li in node.find_all("li", recursive=False):
-                add_list_item(li.get_text(" ", strip=True), ordered=ordered)
-                for img in li.find_all("img"):
-                    handle_img(img)
-            return
+AUTH_STATE_MAX_AGE_SEC = 24 * 3600
 
-        if name == "img":
-            handle_img(node)
-            return
+def read_targets_from_excel(excel_path: Path, sheet: str | int | None,
+                            kb_col: str | None, url_col: str | None):
+    # read_only streams rows instead of materializing the workbook in a DataFrame
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if isinstance(sheet, str) else wb.worksheets[sheet or 0]
+        rows = ws.iter_rows(values_only=True)
+        headers = [str(c).strip() for c in next(rows, ())]
 
-        if name == "table":
-            # Simple fallback: table to text
-            txt = node.get_text("\n", strip=True)
-            if txt:
-                add_text_paragraph(txt)
-            for img in node.find_all("img"):
-                handle_img(img)
-            return
+        kb_col = kb_col or ("KB" if "KB" in headers else None)
+        url_col = url_col or ("URL" if "URL" in headers else None)
 
-        # default: recurse direct children to keep order
-        for child in node.children:
-            if isinstance(child, Tag):
-                walk(child)
+        if not kb_col and not url_col:
+            raise ValueError(
+                f"Excel must contain a '{'KB'}' column or a '{'URL'}' column. Found: {headers}"
+            )
 
-    for child in container.children:
-        if isinstance(child, Tag):
-            walk(child)
+        kb_i = headers.index(kb_col) if kb_col in headers else None
+        url_i = headers.index(url_col) if url_col in headers else None
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    doc.save(str(output_path))
+        def cell(row, i) -> str:
+            if i is None or i >= len(row) or row[i] is None:
+                return ""
+            v = str(row[i]).strip()
+            return "" if v.lower() == "nan" else v
 
-    # Cleanup temp image dir
-    try:
-        shutil.rmtree(temp_dir, ignore_errors=True)
-    except Exception:
-        pass
+        targets = []
+        for rownum, row in enumerate(rows, start=2):
+            kb = cell(row, kb_i)
+            url = cell(row, url_i)
 
+            if not kb and not url:
+                continue
 
-# -------------------------
-# Batch: Excel reading + crawling loop
-# -------------------------
+            if kb:
+                # Also covers a KB column that holds a URL
+                kb = extract_kb_number(kb) or kb
 
-def read_targets_from_excel(excel_path: Path, sheet: str | int | None,
-                            kb_col: str | None, url_col: str | None):
-    df = pd.read_excel(excel_path, sheet_name=sheet, engine="openpyxl")
-    df.columns = [str(c).strip() for c in df.columns]
+            if not kb and url:
+                kb = extract_kb_number(url) or ""
 
-    kb_col = kb_col or ("KB" if "KB" in df.columns else None)
-    url_col = url_col or ("URL" if "URL" in df.columns else None)
+            targets.append({"row": rownum, "kb": kb, "url": url})
+    finally:
+        wb.close()
+    return targets, headers
 
-    if not kb_col and not url_col:
-        raise ValueError(
-            f"Excel must contain a '{'KB'}' column or a '{'URL'}' column. Found: {list(df.columns)}"
-        )
 
-    targets = []
-    for idx, row in df.iterrows():
-        kb = str(row.get(kb_col, "")).strip() if kb_col else ""
-        url = str(row.get(url_col, "")).strip() if url_col else ""
+def process_target(page, context, t: dict, i: int, total: int, args, out_dir: Path,
+                   base_host: str, headed: bool) -> dict:
+    rownum = t["row"]
+    kb = (t["kb"] or "").strip()
+    url = (t["url"] or "").strip()
 
-        kb = kb if kb and kb.lower() != "nan" else ""
-        url = url if url and url.lower() != "nan" else ""
+    # Build URL if only KB number provided
+    if not url and kb:
+        if not base_host:
+            raise ValueError("You provided KB numbers but no --base-host. Example: --base-host https://myservice.lloyds.com")
+        url = base_host + args.url_template.format(KB=kb)
 
-        if not kb and not url:
-            continue
+    # If URL is the /target/ wrapper, optionally decode to direct kb_view
+    if url and (not args.skip_direct):
+        url = decode_target_to_direct_url(url)
+
+    # Determine output filename (KB number preferred)
+    kb_for_name = extract_kb_number(kb) or extract_kb_number(url) or f"ROW{rownum}"
+    outfile = out_dir / f"{safe_filename(kb_for_name)}.docx"
+
+    print(f"\n[{i}/{total}] Row {rownum} -> {kb_for_name} -> {url}")
+    started = time.time()
+    status = "OK"
+    error = ""
+    final_url = ""
+    title = ""
 
-        if kb:
-            kb_match = extract_kb_number(kb)
-            if kb_match:
-                kb = kb_match
-            else:
-                # If kb column contains a URL, extract KB from it
-                kb2 = extract_kb_number(kb)
-                kb = kb2 or kb
+    try:
+        blocks = []
+
+        # Statically rendered KBs don't need the renderer at all
+        probed = None if args.no_probe else probe_static_html(context, url, args.timeout, args.min_chars)
+        if probed:
+            html, final_url = probed
+            title, container = extract_main_container(html)
+            blocks = container_to_blocks(container)
+            observed = sum(len(b.get("text") or "") for b in blocks)
+            if observed < args.min_chars:
+                # Probably a JS shell; render it properly
+                blocks = []
+
+        if not blocks:
+            goto_with_sso_retry(page, url, timeout_ms=args.timeout, headed=headed)
+
+            # If redirected to login mid-batch, let user fix once and continue
+            if looks_like_login(page.url):
+                if not headed:
+                    raise RuntimeError("Redirected to SSO in headless mode. Re-run with --headed.")
+                input("🔐 SSO appeared again. Complete login, then press ENTER to continue...")
+                goto_with_sso_retry(page, url, timeout_ms=args.timeout, headed=headed)
+
+            # Wait for content
+            observed = wait_for_text_length(page, min_chars=args.min_chars, timeout_ms=args.timeout)
+            final_url = page.url
+
+            # Extract in-page, BS4 as fallback
+            try:
+                title, blocks = extract_blocks(page)
+            except Exception:
+                blocks = []
+            if not blocks:
+                html = stripped_page_content(page)
+                title, container = extract_main_container(html)
+                blocks = container_to_blocks(container)
+
+        # Save DOCX (main content + images)
+        build_docx(title=title, source_url=final_url, blocks=blocks, page=page, context=context,
+                   output_path=outfile, max_image_width_in=6.0)
+
+        if observed < max(200, args.min_chars // 2):
+            status = "WARN_THIN_CONTENT"
+
+    except Exception as e:
+        status = "FAIL"
+        error = str(e)[:2000]
+        print(f"❌ Failed: {error}")
+
+    elapsed = round(time.time() - started, 2)
+    return {
+        "row": rownum,
+        "kb": kb_for_name,
+        "input_url": t["url"] or "",
+        "used_url": url,
+        "final_url": final_url,
+        "title": title,
+        "outfile": str(outfile),
+        "status": status,
+        "elapsed_sec": elapsed,
+        "error": error
+    }
+
+
+def run_worker(jobs: queue.Queue, results: list, lock: threading.Lock, total: int,
+               args, auth_state: Path, out_dir: Path, base_host: str) -> None:
+    """
+    One browser per thread (sync Playwright objects are bound to the thread
+    that created them); the session comes from the shared auth snapshot.
+    """
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=(not args.headed))
+        context = browser.new_context(
+            storage_state=str(auth_state),
+            viewport={"width": 1400, "height": 900},
+        )
+        page = context.new_page()
+        page.set_default_timeout(args.timeout)
+        block_nonessential(page)
+        attach_debug(page, verbose=args.verbose)
 
-        if not kb and url:
-            kb = extract_kb_number(url) or ""
+        while True:
+            try:
+                i, t = jobs.get_nowait()
+            except queue.Empty:
+                break
+            # No interactive SSO from worker threads; a bounce is reported as FAIL
+            res = process_target(page, context, t, i, total, args, out_dir, base_host, headed=False)
+            with lock:
+                results.append(res)
+            time.sleep(max(0.0, args.sleep))
 
-        targets.append({"row": int(idx) + 2, "kb": kb, "url": url})
-    return targets, df
+        context.close()
+        browser.close()
 
 
 def main():
@@ -438,6 +888,8 @@ def main():
     ap.add_argument("--outdir", default="kb_exports", help="Output folder for docx files")
     ap.add_argument("--profile-dir", default="pw_profile", help="Persistent Playwright profile directory")
     ap.add_argument("--relogin", action="store_true", help="Delete profile dir and login again")
+    ap.add_argument("--auth-state", default="kb_auth.json",
+                    help="Storage-state snapshot reused on later runs instead of the profile dir")
     ap.add_argument("--headed", action="store_true", help="Run with a visible browser (recommended for SSO)")
     ap.add_argument("--timeout", type=int, default=240_000, help="Timeout ms per KB (default 240000)")
     ap.add_argument("--min-chars", type=int, default=800, help="Minimum text length to treat page as loaded")
@@ -446,8 +898,12 @@ def main():
                     help="Template for KB URL if only KB number is given")
     ap.add_argument("--skip-direct", action="store_true",
                     help="Do not decode /target/ url into direct kb_view.do url")
+    ap.add_argument("--no-probe", action="store_true",
+                    help="Always render in the browser (skip the plain-HTTP pre-fetch)")
     ap.add_argument("--sleep", type=float, default=1.0, help="Seconds to sleep between KBs (default 1.0)")
     ap.add_argument("--max", type=int, default=0, help="Max KBs to process (0 = all)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="KBs processed in parallel, one browser each (default 1)")
     ap.add_argument("--verbose", action="store_true", help="Verbose Playwright console/request logging")
     args = ap.parse_args()
 
@@ -460,6 +916,11 @@ def main():
         print(f"🧹 Removing profile dir for relogin: {profile_dir}")
         shutil.rmtree(profile_dir, ignore_errors=True)
 
+    auth_state = Path(args.auth_state)
+    if args.relogin and auth_state.exists():
+        auth_state.unlink()
+    use_snapshot = auth_state.exists() and (time.time() - auth_state.stat().st_mtime) < AUTH_STATE_MAX_AGE_SEC
+
     sheet = args.sheet
     try:
         sheet = int(sheet)
@@ -478,18 +939,31 @@ def main():
         return
 
     base_host = args.base_host.strip().rstrip("/")
-    url_template = args.url_template
+    if not base_host and any(not t["url"] for t in targets):
+        raise ValueError("You provided KB numbers but no --base-host. Example: --base-host https://myservice.lloyds.com")
 
     results = []
+    snapshot_saved = False
 
     with sync_playwright() as p:
-        context = p.chromium.launch_persistent_context(
-            user_data_dir=str(profile_dir),
-            headless=(not args.headed),
-            viewport={"width": 1400, "height": 900},
-        )
+        browser = None
+        if use_snapshot:
+            # Ephemeral context from the snapshot: no profile DB to load or lock
+            print(f"🔑 Reusing auth snapshot: {auth_state}")
+            browser = p.chromium.launch(headless=(not args.headed))
+            context = browser.new_context(
+                storage_state=str(auth_state),
+                viewport={"width": 1400, "height": 900},
+            )
+        else:
+            context = p.chromium.launch_persistent_context(
+                user_data_dir=str(profile_dir),
+                headless=(not args.headed),
+                viewport={"width": 1400, "height": 900},
+            )
         page = context.new_page()
         page.set_default_timeout(args.timeout)
+        block_nonessential(page)
         attach_debug(page, verbose=args.verbose)
 
         # Open a harmless page to establish context (optional)
@@ -506,77 +980,41 @@ def main():
                 raise RuntimeError("SSO requires interaction. Re-run with --headed.")
             input("✅ Complete SSO in the browser, then press ENTER to begin batch...")
 
-        for i, t in enumerate(targets, start=1):
-            rownum = t["row"]
-            kb = (t["kb"] or "").strip()
-            url = (t["url"] or "").strip()
-
-            # Build URL if only KB number provided
-            if not url and kb:
-                if not base_host:
-                    raise ValueError("You provided KB numbers but no --base-host. Example: --base-host https://myservice.lloyds.com")
-                url = base_host + url_template.format(KB=kb)
-
-            # If URL is the /target/ wrapper, optionally decode to direct kb_view
-            if url and (not args.skip_direct):
-                url = decode_target_to_direct_url(url)
-
-            # Determine output filename (KB number preferred)
-            kb_for_name = extract_kb_number(kb) or extract_kb_number(url) or f"ROW{rownum}"
-            outfile = out_dir / f"{safe_filename(kb_for_name)}.docx"
-
-            print(f"\n[{i}/{len(targets)}] Row {rownum} -> {kb_for_name} -> {url}")
-            started = time.time()
-            status = "OK"
-            error = ""
-            final_url = ""
-            title = ""
+        if args.workers > 1:
+            # Workers pick the session up from the snapshot
+            context.storage_state(path=str(auth_state))
+        else:
+            for i, t in enumerate(targets, start=1):
+                res = process_target(page, context, t, i, len(targets), args, out_dir, base_host,
+                                     headed=args.headed)
+                results.append(res)
 
-            try:
-                goto_with_sso_retry(page, url, timeout_ms=args.timeout, headed=args.headed)
-
-                # If redirected to login mid-batch, let user fix once and continue
-                if looks_like_login(page.url):
-                    if not args.headed:
-                        raise RuntimeError("Redirected to SSO in headless mode. Re-run with --headed.")
-                    input("🔐 SSO appeared again. Complete login, then press ENTER to continue...")
-                    goto_with_sso_retry(page, url, timeout_ms=args.timeout, headed=args.headed)
+                # Snapshot auth once we know the session works, for the next run
+                if not snapshot_saved and res["status"] != "FAIL" and not looks_like_login(res["final_url"]):
+                    context.storage_state(path=str(auth_state))
+                    snapshot_saved = True
 
-                # Wait for content
-                observed = wait_for_text_length(page, min_chars=args.min_chars, timeout_ms=args.timeout)
-                final_url = page.url
-
-                # Save DOCX (main content + images)
-                html = page.content()
-                title, container = extract_main_container(html)
-                build_docx(title=title, source_url=final_url, container=container, page=page, context=context,
-                           output_path=outfile, max_image_width_in=6.0)
-
-                if observed < max(200, args.min_chars // 2):
-                    status = "WARN_THIN_CONTENT"
-
-            except Exception as e:
-                status = "FAIL"
-                error = str(e)[:2000]
-                print(f"❌ Failed: {error}")
-
-            elapsed = round(time.time() - started, 2)
-            results.append({
-                "row": rownum,
-                "kb": kb_for_name,
-                "input_url": t["url"] or "",
-                "used_url": url,
-                "final_url": final_url,
-                "title": title,
-                "outfile": str(outfile),
-                "status": status,
-                "elapsed_sec": elapsed,
-                "error": error
-            })
-
-            time.sleep(max(0.0, args.sleep))
+                time.sleep(max(0.0, args.sleep))
 
         context.close()
+        if browser:
+            browser.close()
+
+    if args.workers > 1:
+        jobs = queue.Queue()
+        for i, t in enumerate(targets, start=1):
+            jobs.put((i, t))
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=run_worker,
+                             args=(jobs, results, lock, len(targets), args, auth_state, out_dir, base_host))
+            for _ in range(min(args.workers, len(targets)))
+        ]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        results.sort(key=lambda r: r["row"])
 
     # Write results log
     results_df = pd.DataFrame(results)
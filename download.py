@@ -1,19 +1,71 @@
+import requests
 from playwright.sync_api import sync_playwright
 
+from kb_common import (
+    DEFAULT_UA,
+    decode_target_to_direct_url,
+    extract_kb_number,
+    load_storage_state,
+    looks_like_login,
+)
+
 URL = "https://myservice.lloyds.com/now/nav/ui/classic/params/target/kb_view.do%3Fsysparm_article%3DKB0010611"
 STATE_FILE = "lloyds_storage_state.json"
 OUT_FILE = "KB0010611_fullpage.html"
+MIN_CHARS = 2000
+# Markup only the article itself carries (the /now/nav/ui wrapper is a JS shell)
+ARTICLE_MARKERS = ('id="kb_article"', "kb-article", "sn-kb-article", "knowledge-article", "<article")
+
+
+def fetch_with_cookies(url, state_file):
+    """Replay the saved Playwright cookies through requests; no browser needed."""
+    state = load_storage_state(state_file)
+
+    jar = requests.cookies.RequestsCookieJar()
+    for c in state.get("cookies", []):
+        jar.set(c["name"], c["value"], domain=c["domain"], path=c.get("path", "/"))
+
+    s = requests.Session()
+    s.cookies = jar
+    s.headers["User-Agent"] = DEFAULT_UA
+    return s.get(url, timeout=60)
+
+
+def fetch_with_browser(url, state_file):
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        context = browser.new_context(storage_state=load_storage_state(state_file))
+        page = context.new_page()
+
+        page.goto(url, wait_until="networkidle", timeout=60000)
+
+        html = page.content()
+        browser.close()
+    return html
+
+
+def looks_like_article(r) -> bool:
+    if not r.ok or looks_like_login(r.url) or len(r.text) < MIN_CHARS:
+        return False
+    kb = extract_kb_number(URL)
+    return (kb is not None and kb in r.text) or any(m in r.text for m in ARTICLE_MARKERS)
+
 
-with sync_playwright() as p:
-    browser = p.chromium.launch(headless=True)
-    context = browser.new_context(storage_state=STATE_FILE)
-    page = context.new_page()
+# The wrapper only renders in a browser; requests has to hit kb_view.do itself
+try:
+    r = fetch_with_cookies(decode_target_to_direct_url(URL), STATE_FILE)
+except requests.RequestException as e:
+    print(f"⚠️ Direct fetch failed: {e}")
+    r = None
 
-    page.goto(URL, wait_until="networkidle", timeout=60000)
+if r is not None and looks_like_article(r):
+    html = r.text
+else:
+    # Looks like an SSO bounce; let the browser deal with it
+    print("⚠️ Direct fetch did not return the page; falling back to Playwright...")
+    html = fetch_with_browser(URL, STATE_FILE)
 
-    html = page.content()
-    with open(OUT_FILE, "w", encoding="utf-8") as f:
-        f.write(html)
+with open(OUT_FILE, "w", encoding="utf-8") as f:
+    f.write(html)
 
-    print(f"✅ Saved rendered HTML to {OUT_FILE}")
-    browser.close()
+print(f"✅ Saved rendered HTML to {OUT_FILE}")
@@ -0,0 +1,83 @@
+"""
+kb_common.py - helpers shared by the KB capture scripts (onefile.py,
+lloyds_servicenow_capture.py, download.py) and the Word exporters
+(to_word.py, word_with_pic.py, batch_kb_to_docx.py). Pure stdlib, so
+importing it does not pull in Playwright.
+"""
+
+import functools
+import json
+import re
+import time
+from pathlib import Path
+from urllib.parse import unquote, urlsplit, urlunsplit
+
+try:
+    import orjson  # optional, faster for big cookie jars
+except ImportError:
+    orjson = None
+
+
+DEFAULT_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/118.0.0.0 Safari/537.36"
+)
+
+_RE_SAFE = re.compile(r"[^\w\-\.]+")
+_RE_KB = re.compile(r"(KB\d+)")
+_RE_LOGIN = re.compile(r"login|sso|saml|auth|okta|adfs|signin|microsoftonline\.com", re.IGNORECASE)
+
+
+def stamp() -> str:
+    return time.strftime("%Y%m%d_%H%M%S")
+
+
+def safe_filename(name: str, default: str = "page") -> str:
+    return _RE_SAFE.sub("_", (name or "").strip() or default)[:180]
+
+
+def looks_like_login(url: str) -> bool:
+    return bool(_RE_LOGIN.search(url or ""))
+
+
+@functools.lru_cache(maxsize=65536)
+def extract_kb_number(text: str | None) -> str | None:
+    m = _RE_KB.search(text or "")
+    return m.group(1) if m else None
+
+
+@functools.lru_cache(maxsize=256)
+def decode_target_to_direct_url(url: str) -> str:
+    """
+    Converts:
+      .../target/kb_view.do%3Fsysparm_article%3DKB0010611
+    into:
+      https://<host>/kb_view.do?sysparm_article=KB0010611
+    """
+    parts = urlsplit(url)
+    i = parts.path.find("/target/")
+    if i < 0 or i + 8 == len(parts.path):
+        return url
+    decoded = unquote(parts.path[i + 8:])  # kb_view.do?sysparm_article=KB...
+    if decoded.startswith(("http://", "https://")):
+        return decoded
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return url
+    return urlunsplit((parts.scheme, parts.netloc, "/" + decoded.lstrip("/"), "", ""))
+
+
+def load_storage_state(path: Path) -> dict:
+    """
+    Parse a Playwright storage_state file and drop expired cookies, so the
+    browser gets a smaller jar as a dict instead of re-reading the path.
+    Session cookies (expires -1/0) are kept.
+    """
+    raw = Path(path).read_bytes()
+    state = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    now = time.time()
+    state["cookies"] = [
+        c for c in state.get("cookies", [])
+        if c.get("expires", -1) in (-1, 0) or c["expires"] > now
+    ]
+    return state
@@ -24,54 +24,216 @@ python lloyds_servicenow_capture.py save \
 python lloyds_servicenow_capture.py save \
   --url "https://myservice.lloyds.com/now/nav/ui/classic/params/target/kb_view.do?sysparm_article=KB0010611" \
   --state auth_state.json --format html --out KB0010611_rendered.html
+
+# Several KBs in one browser session (--out is then a directory)
+python lloyds_servicenow_capture.py save \
+  --url "https://myservice.lloyds.com/kb_view.do?sysparm_article=KB0010611" \
+        "https://myservice.lloyds.com/kb_view.do?sysparm_article=KB0010612" \
+  --state auth_state.json --format mhtml --out kb_archive
 """
 import argparse
+import base64
+import hashlib
 import json
 import os
+import queue
 import sys
+import threading
 import time
 from pathlib import Path
+from urllib.parse import unquote
 
 from playwright.sync_api import sync_playwright, TimeoutError as PWTimeoutError
 
-DEFAULT_UA = (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-    "AppleWebKit/537.36 (KHTML, like Gecko) "
-    "Chrome/118.0.0.0 Safari/537.36"
-)
-
-
-def scroll_lazy(page, step=900, delay_ms=400):
-    """Scroll to trigger lazy-loaded content."""
-    page.evaluate(
-        """async ({step, delay}) => {
-            const sleep = ms => new Promise(r => setTimeout(r, ms));
-            let prevHeight = 0;
-            for (let i = 0; i < 1000; i++) {
-              window.scrollBy(0, step);
-              await sleep(delay);
-              const sh = document.documentElement.scrollHeight;
-              if (sh === prevHeight) break;
-              prevHeight = sh;
-            }
-        }""",
-        {"step": step, "delay": delay_ms},
-    )
-    # Small settle time
-    page.wait_for_timeout(1200)
+from kb_common import DEFAULT_UA, extract_kb_number, load_storage_state, looks_like_login
+
+
+# Trim subsystems a headless capture never uses (faster launch, less RSS).
+# --single-process/--no-zygote are left out: they crash Chromium under load.
+LAUNCH_ARGS = [
+    "--disable-gpu",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-default-apps",
+    "--no-first-run",
+]
+
+
+def page_height(page, cdp=None) -> int:
+    """Document height; one CDP call when a session is at hand."""
+    if cdp is not None:
+        m = cdp.send("Page.getLayoutMetrics")
+        return int((m.get("cssContentSize") or m["contentSize"])["height"])
+    return page.evaluate("() => document.documentElement.scrollHeight")
+
+
+def scroll_lazy(page, cdp=None, stops=(0.25, 0.5, 0.75, 1.0)):
+    """
+    Scroll to trigger lazy-loaded content. Jumps through a few fractions of
+    the page height and lets the network settle at each stop, instead of
+    900px steps with a fixed 400ms sleep.
+    """
+    height = page_height(page, cdp)
+    for frac in stops:
+        page.evaluate("h => window.scrollTo(0, h)", int(height * frac))
+        wait_quiet(page, quiet_ms=300, max_ms=2000, allow_inflight=2)
+    # Lazy content may have grown the page; one more jump to the new bottom
+    grown = page_height(page, cdp)
+    if grown > height:
+        page.evaluate("h => window.scrollTo(0, h)", grown)
+    # Settle on actual activity, not a worst-case sleep
+    page.wait_for_load_state("domcontentloaded")
+    wait_quiet(page, quiet_ms=800, max_ms=3000)
+
+
+# Long-lived streams never "finish"; counting them would stall the idle wait
+QUIET_IGNORED_TYPES = {"websocket", "eventsource"}
+
+
+def wait_quiet(page, quiet_ms=1500, max_ms=8000, allow_inflight=2):
+    """
+    Wait until at most `allow_inflight` requests have been pending for
+    `quiet_ms`, capped at `max_ms`. ServiceNow long-polls, so a strict
+    networkidle often never arrives.
+    """
+    pending = set()
+
+    def on_request(req):
+        if req.resource_type not in QUIET_IGNORED_TYPES:
+            pending.add(req)
+
+    def on_done(req):
+        pending.discard(req)
+
+    page.on("request", on_request)
+    page.on("requestfinished", on_done)
+    page.on("requestfailed", on_done)
+    try:
+        start = time.monotonic()
+        idle_start = None
+        while (time.monotonic() - start) * 1000 < max_ms:
+            if len(pending) <= allow_inflight:
+                if idle_start is None:
+                    idle_start = time.monotonic()
+                if (time.monotonic() - idle_start) * 1000 >= quiet_ms:
+                    return
+            else:
+                idle_start = None
+            page.wait_for_timeout(100)
+    finally:
+        page.remove_listener("request", on_request)
+        page.remove_listener("requestfinished", on_done)
+        page.remove_listener("requestfailed", on_done)
 
 
-def open_and_wait(page, url, wait="networkidle", timeout_ms=120000):
-    """Navigate and wait for the page to load/settle."""
-    page.goto(url, wait_until=wait, timeout=timeout_ms)
-    # Some SPAs/ServiceNow pages keep fetching; give it a moment
-    page.wait_for_timeout(1500)
+# Page.lifecycleEvent names that mean "good enough to capture"
+SETTLED_EVENTS = ("firstMeaningfulPaint", "networkAlmostIdle")
 
 
-def login_and_save_state(url: str, state_path: Path, viewport=(1366, 900)):
+class LifecycleWatch:
     """
-    Opens a visible browser so you can complete SSO/MFA. After the
-    target page loads successfully, session cookies are saved to state_path.
+    Records Page.lifecycleEvent names for the main frame's current load on a
+    CDP session. Events are delivered while Playwright is pumping its
+    connection, so waiting still yields via short wait_for_timeout calls.
+    """
+
+    def __init__(self, page, cdp):
+        self.page = page
+        self.seen = set()
+        cdp.send("Page.enable")
+        cdp.send("Page.setLifecycleEventsEnabled", {"enabled": True})
+        self.main_frame = cdp.send("Page.getFrameTree")["frameTree"]["frame"]["id"]
+        cdp.on("Page.lifecycleEvent", self._on_event)
+
+    def _on_event(self, params):
+        if params.get("frameId") != self.main_frame:
+            return
+        if params.get("name") == "init":
+            # New document in the main frame; forget the previous load
+            self.seen.clear()
+        self.seen.add(params.get("name"))
+
+    def reset(self):
+        self.seen.clear()
+
+    def wait_any(self, names, max_ms=8000):
+        """Return the first of `names` seen, or None once `max_ms` passes."""
+        start = time.monotonic()
+        while (time.monotonic() - start) * 1000 < max_ms:
+            for name in names:
+                if name in self.seen:
+                    return name
+            self.page.wait_for_timeout(50)
+        return None
+
+
+def open_and_wait(page, url, wait="domcontentloaded", timeout_ms=120000, ready_selector=None, lifecycle=None):
+    """
+    Navigate and wait for the page to load/settle. With `ready_selector`,
+    return from goto on "commit" and wait for that node instead.
+    """
+    if lifecycle is not None:
+        lifecycle.reset()
+    if ready_selector:
+        page.goto(url, wait_until="commit", timeout=timeout_ms)
+        page.wait_for_selector(ready_selector, state="attached", timeout=timeout_ms)
+    else:
+        page.goto(url, wait_until=wait, timeout=timeout_ms)
+    if lifecycle is not None:
+        # Browser's own readiness signals for this load
+        lifecycle.wait_any(SETTLED_EVENTS)
+    else:
+        # Some SPAs/ServiceNow pages keep fetching; wait for it to go (mostly) quiet
+        wait_quiet(page)
+
+
+def save_tiled_screenshot(page, cdp, out_base: Path, tile_h=2048, quality=60):
+    """
+    Full-page screenshot as <out_base>_001.jpg, _002.jpg, ... clipped one
+    tile at a time, so the framebuffer never spans the whole scroll height.
+    """
+    m = cdp.send("Page.getLayoutMetrics")
+    size = m.get("cssContentSize") or m["contentSize"]
+    width, height = int(size["width"]), int(size["height"])
+    out_base.parent.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for n, y in enumerate(range(0, max(height, 1), tile_h), start=1):
+        shot = cdp.send(
+            "Page.captureScreenshot",
+            {
+                "format": "jpeg",
+                "quality": quality,
+                "captureBeyondViewport": True,
+                "clip": {"x": 0, "y": y, "width": width, "height": min(tile_h, height - y), "scale": 1},
+            },
+        )
+        path = out_base.with_name(f"{out_base.name}_{n:03d}.jpg")
+        path.write_bytes(base64.b64decode(shot["data"]))
+        paths.append(path)
+    return paths
+
+
+def has_login_form(page) -> bool:
+    """ServiceNow can serve login.do in place, under the target URL; look for its password box."""
+    for frame in page.frames:
+        try:
+            if frame.query_selector("input[type=password]"):
+                return True
+        except Exception:
+            continue
+    return False
+
+
+def login_and_save_state(url: str, state_path: Path, viewport=(1366, 900), debug_screenshot=None,
+                         ready_url_contains="kb_view.do", ready_selector=None, login_timeout_ms=600_000):
+    """
+    Opens a visible browser so you can complete SSO/MFA. Once the browser
+    has left the start URL and come back to one containing `ready_url_contains`
+    with no login form showing (or, with that empty, once you press ENTER),
+    session cookies are saved to state_path.
     """
     with sync_playwright() as pw:
         browser = pw.chromium.launch(headless=False)
@@ -82,14 +244,43 @@ def login_and_save_state(url: str, state_path: Path, viewport=(1366, 900)):
         page = ctx.new_page()
 
         print("[info] Opening login page. Complete SSO/MFA in the browser window...")
-        open_and_wait(page, url)
+        # The URL/ENTER wait below decides when login is done
+        open_and_wait(page, url, wait="commit")
+        start_url = page.url
 
-        # Tip printed to terminal for user confirmation
         print("\n=== ACTION REQUIRED ===")
-        print("1) In the opened browser, complete your login (SSO/MFA).")
-        print("2) Wait until the *target KB article page* is fully visible.")
-        print("3) Return here and press ENTER to continue.")
-        input("Press ENTER only when the KB page content is visible... ")
+        print("In the opened browser, complete your login (SSO/MFA).")
+        landed = False
+        if ready_url_contains:
+            # Detect landing on the target page instead of waiting for ENTER. The
+            # start URL already matches, so only count it after an SSO round trip.
+            print(f"[info] Waiting for a URL containing '{ready_url_contains}'...")
+            left_start = False
+
+            def is_ready(u: str) -> bool:
+                nonlocal left_start
+                if u != start_url:
+                    left_start = True
+                return left_start and ready_url_contains in u and not looks_like_login(u)
+
+            try:
+                page.wait_for_url(is_ready, timeout=login_timeout_ms)
+                if ready_selector:
+                    page.wait_for_selector(ready_selector, state="attached", timeout=login_timeout_ms)
+                else:
+                    page.wait_for_load_state("domcontentloaded", timeout=login_timeout_ms)
+                landed = not has_login_form(page)
+                if not landed:
+                    print("[warn] The target URL is showing a login form.")
+            except PWTimeoutError:
+                print("[warn] Target page was not detected in time.")
+        if not landed:
+            if not sys.stdin.isatty():
+                print("[error] Login not detected and no terminal to confirm on; session NOT saved.")
+                browser.close()
+                return False
+            print("Wait until the *target KB article page* is fully visible, then return here.")
+            input("Press ENTER only when the KB page content is visible... ")
 
         # Final settle + lazy-load trigger
         try:
@@ -99,7 +290,7 @@ def login_and_save_state(url: str, state_path: Path, viewport=(1366, 900)):
 
         # Quick check: ensure we are not on an auth page (heuristic)
         url_now = page.url
-        if any(k in url_now.lower() for k in ["login", "signin", "sso", "adfs"]):
+        if looks_like_login(url_now):
             print("[warn] You appear to still be on a login page. "
                   "If this is incorrect, continue; otherwise, log in then retry.")
         else:
@@ -110,39 +301,63 @@ def login_and_save_state(url: str, state_path: Path, viewport=(1366, 900)):
         ctx.storage_state(path=str(state_path))
         print(f"[done] Auth/session saved to: {state_path}")
 
-        # Keep a quick screenshot for validation (optional)
-        try:
-            shot_path = state_path.with_suffix(".png")
-            page.screenshot(path=str(shot_path), full_page=True)
-            print(f"[info] Screenshot saved to: {shot_path}")
-        except Exception:
-            pass
+        # Quick screenshot for validation (opt-in; full-page PNG is slow)
+        if debug_screenshot == "full":
+            try:
+                tiles = save_tiled_screenshot(page, ctx.new_cdp_session(page), state_path.with_suffix(""))
+                print(f"[info] Screenshot saved as {len(tiles)} tile(s): {state_path.with_suffix('')}_NNN.jpg")
+            except Exception:
+                pass
+        elif debug_screenshot:
+            try:
+                shot_path = state_path.with_suffix(".jpg")
+                page.screenshot(path=str(shot_path), type="jpeg", quality=60, full_page=False)
+                print(f"[info] Screenshot saved to: {shot_path}")
+            except Exception:
+                pass
 
         browser.close()
+    return True
 
 
-def save_mhtml(ctx, url: str, out_path: Path, viewport=(1366, 900)):
-    page = ctx.new_page()
-    open_and_wait(page, url)
-    scroll_lazy(page)
+def load_page(page, cdp, url: str, ready_selector=None, lifecycle=None):
+    """Navigate once and trigger lazy content; every format captures from here."""
+    open_and_wait(page, url, ready_selector=ready_selector, lifecycle=lifecycle)
+    scroll_lazy(page, cdp)
+
+
+def save_mhtml(page, cdp, out_path: Path):
     # Use CDP to capture MHTML
-    cdp = ctx.new_cdp_session(page)
-    cdp.send("Page.enable")
     snapshot = cdp.send("Page.captureSnapshot", {"format": "mhtml"})
     data = snapshot.get("data", "")
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(data, encoding="utf-8")
+    # MHTML is 7-bit (base64/quoted-printable parts); latin-1 is a straight copy
+    try:
+        raw = data.encode("latin-1")
+    except UnicodeEncodeError:
+        raw = data.encode("utf-8")
+    del data, snapshot
+    out_path.write_bytes(raw)
     print(f"[done] MHTML saved: {out_path}")
-    page.close()
 
 
-def save_pdf(ctx, url: str, out_path: Path, viewport=(1366, 900)):
-    page = ctx.new_page()
-    open_and_wait(page, url)
-    scroll_lazy(page)
-    # Use CDP printToPDF for consistent results (A4 by default)
-    cdp = ctx.new_cdp_session(page)
-    cdp.send("Page.enable")
+PDF_CHUNK_SIZE = 256 * 1024
+
+
+def save_pdf(page, cdp, out_path: Path):
+    # A4 with the same margins either way
+    if cdp is None:
+        # Playwright streams Page.printToPDF itself; headless Chromium only
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        page.pdf(
+            path=str(out_path),
+            format="A4",
+            print_background=True,
+            margin={"top": "0.4in", "bottom": "0.6in", "left": "0.4in", "right": "0.4in"},
+        )
+        print(f"[done] PDF saved: {out_path}")
+        return
+    # Headful browsers cannot use page.pdf(); go through CDP directly
     pdf_obj = cdp.send(
         "Page.printToPDF",
         {
@@ -156,49 +371,245 @@ def save_pdf(ctx, url: str, out_path: Path, viewport=(1366, 900)):
             "preferCSSPageSize": False,
             "scale": 1.0,
             "displayHeaderFooter": False,
+            "transferMode": "ReturnAsStream",
         },
     )
-    pdf_bytes = bytes(pdf_obj["data"], "utf-8")
-    # Data is base64 per CDP; decode
-    import base64
-    pdf_bytes = base64.b64decode(pdf_obj["data"])
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_bytes(pdf_bytes)
+    # Pull the PDF through a CDP stream so only one chunk is held at a time
+    stream = pdf_obj["stream"]
+    try:
+        with open(out_path, "wb") as f:
+            while True:
+                chunk = cdp.send("IO.read", {"handle": stream, "size": PDF_CHUNK_SIZE})
+                data = chunk.get("data", "")
+                f.write(base64.b64decode(data) if chunk.get("base64Encoded") else data.encode("latin-1"))
+                if chunk.get("eof"):
+                    break
+    finally:
+        cdp.send("IO.close", {"handle": stream})
     print(f"[done] PDF saved: {out_path}")
-    page.close()
 
 
-def save_rendered_html(ctx, url: str, out_path: Path, viewport=(1366, 900)):
-    page = ctx.new_page()
-    open_and_wait(page, url)
-    scroll_lazy(page)
-    html = page.content()
+def save_rendered_html(page, cdp, out_path: Path):
+    # One getOuterHTML on the document node; depth 0 keeps getDocument from
+    # shipping the whole node tree over the protocol first
+    root = cdp.send("DOM.getDocument", {"depth": 0})
+    raw = cdp.send("DOM.getOuterHTML", {"nodeId": root["root"]["nodeId"]})["outerHTML"].encode("utf-8")
+    # Sidecar hash lets periodic archiving skip identical pages
+    digest = hashlib.sha256(raw).hexdigest()
+    sidecar = out_path.with_name(out_path.name + ".sha256")
+    if out_path.exists() and sidecar.exists() and sidecar.read_text().strip() == digest:
+        print(f"[info] Rendered HTML unchanged: {out_path}")
+        return
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(html, encoding="utf-8")
+    out_path.write_bytes(raw)
+    sidecar.write_text(digest + "\n")
     print(f"[done] Rendered HTML saved: {out_path}")
-    page.close()
 
 
-def save_with_state(url: str, state_path: Path, out: Path, fmt: str, viewport=(1366, 900), headless=True):
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(headless=headless, args=["--disable-gpu", "--no-sandbox"])
-        ctx = browser.new_context(
-            user_agent=DEFAULT_UA,
-            viewport={"width": viewport[0], "height": viewport[1]},
-            storage_state=str(state_path) if state_path.exists() else None,
-        )
+SAVERS = {
+    "mhtml": save_mhtml,
+    "pdf": save_pdf,
+    "html": save_rendered_html,
+}
+
+
+# Replays the login step's localStorage into matching origins before page scripts
+# run. Keys the app has since rewritten in the profile win unless the state is fresh.
+LOCAL_STORAGE_JS = """
+((origins, overwrite) => {
+  const o = origins.find(o => o.origin === location.origin);
+  if (!o) return;
+  try {
+    for (const {name, value} of o.localStorage || []) {
+      if (overwrite || localStorage.getItem(name) === null) localStorage.setItem(name, value);
+    }
+  } catch (e) {}
+})(%s, %s);
+"""
 
+
+def import_state(ctx, state_path: Path, profile_dir: Path):
+    """
+    Seed a persistent profile from the login step's storage_state: cookies
+    (only re-imported when the state file is newer than the last import) and
+    each origin's localStorage, as new_context(storage_state=...) would.
+    """
+    marker = profile_dir / ".state_imported"
+    if not state_path.exists():
+        return
+    state = load_storage_state(state_path)
+    fresh = not marker.exists() or marker.stat().st_mtime < state_path.stat().st_mtime
+    origins = [o for o in state.get("origins", []) if o.get("localStorage")]
+    if origins:
+        ctx.add_init_script(LOCAL_STORAGE_JS % (json.dumps(origins), "true" if fresh else "false"))
+    if not fresh:
+        return
+    cookies = state["cookies"]
+    if cookies:
+        ctx.add_cookies(cookies)
+    marker.touch()
+    print(f"[info] Imported {len(cookies)} cookie(s) from {state_path} into {profile_dir}")
+
+
+class Capturer:
+    """
+    One browser, one context and one page (plus its CDP session) reused for
+    every capture, instead of a Chromium cold start per URL.
+
+        with Capturer(state_path) as cap:
+            cap.capture(url, {"mhtml": Path("KB.mhtml"), "pdf": Path("KB.pdf")})
+    """
+
+    def __init__(self, state_path: Path, viewport=(1366, 900), headless=True, block_types=(),
+                 profile_dir: Path | None = None, ready_selector=None):
+        self.state_path = state_path
+        self.viewport = viewport
+        self.headless = headless
+        self.block_types = set(block_types)
+        self.profile_dir = profile_dir
+        self.ready_selector = ready_selector
+
+    def __enter__(self):
+        self._pw = sync_playwright().start()
+        viewport = {"width": self.viewport[0], "height": self.viewport[1]}
+        if self.profile_dir:
+            # Persistent profile keeps HTTP cache / service workers between runs
+            self.browser = None
+            self.ctx = self._pw.chromium.launch_persistent_context(
+                user_data_dir=str(self.profile_dir),
+                headless=self.headless,
+                args=LAUNCH_ARGS,
+                user_agent=DEFAULT_UA,
+                viewport=viewport,
+            )
+            import_state(self.ctx, self.state_path, self.profile_dir)
+        else:
+            self.browser = self._pw.chromium.launch(headless=self.headless, args=LAUNCH_ARGS)
+            self.ctx = self.browser.new_context(
+                user_agent=DEFAULT_UA,
+                viewport=viewport,
+                storage_state=load_storage_state(self.state_path) if self.state_path.exists() else None,
+            )
+        self.page = self.ctx.pages[0] if self.ctx.pages else self.ctx.new_page()
+        # One CDP session for the page: lifecycle events plus the CDP-based savers
+        self.cdp = self.ctx.new_cdp_session(self.page)
+        if self.block_types:
+            # By URL through CDP: ctx.route() would switch off the HTTP cache
+            # the persistent profile is there to reuse
+            self.cdp.send("Network.enable")
+            self.cdp.send("Network.setBlockedURLs", {"urls": blocked_url_patterns(self.block_types)})
+        self.lifecycle = LifecycleWatch(self.page, self.cdp)
+        return self
+
+    def needs_cdp(self, fmt: str) -> bool:
+        return fmt in ("mhtml", "html") or (fmt == "pdf" and not self.headless)
+
+    def __exit__(self, *exc):
         try:
-            if fmt == "mhtml":
-                save_mhtml(ctx, url, out, viewport)
-            elif fmt == "pdf":
-                save_pdf(ctx, url, out, viewport)
-            elif fmt == "html":
-                save_rendered_html(ctx, url, out, viewport)
-            else:
+            (self.browser or self.ctx).close()
+        finally:
+            self._pw.stop()
+
+    def capture(self, url: str, outputs: dict):
+        """Load `url` once and write each {format: path} in `outputs`."""
+        for fmt in outputs:
+            if fmt not in SAVERS:
                 raise ValueError(f"Unsupported format: {fmt}")
+        try:
+            load_page(self.page, self.cdp, url, ready_selector=self.ready_selector, lifecycle=self.lifecycle)
+            for fmt, out in outputs.items():
+                SAVERS[fmt](self.page, self.cdp if self.needs_cdp(fmt) else None, out)
         finally:
-            browser.close()
+            # Drop the previous document before the next URL
+            self.page.goto("about:blank")
+
+
+# Bytes the rendered DOM (and an image-less PDF) never needs
+HEAVY_RESOURCE_TYPES = {"image", "media", "font"}
+
+# Network.setBlockedURLs matches URLs, not resource types; trailing * lets ?v= through
+RESOURCE_URL_PATTERNS = {
+    "image": ("*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.svg*", "*.ico*", "*.bmp*"),
+    "media": ("*.mp4*", "*.webm*", "*.mp3*", "*.m4a*", "*.ogg*"),
+    "font": ("*.woff*", "*.ttf*", "*.otf*", "*.eot*"),
+}
+
+
+def blocked_url_patterns(types) -> list[str]:
+    return [pat for t in sorted(types) for pat in RESOURCE_URL_PATTERNS.get(t, ())]
+
+
+def blocked_types_for(formats, no_images=False):
+    """MHTML archives the page resources, so only block when it is not requested."""
+    formats = set(formats)
+    if "mhtml" in formats:
+        return set()
+    if formats == {"html"} or no_images:
+        return HEAVY_RESOURCE_TYPES
+    return set()
+
+
+def out_path_for(url: str, out: Path, fmt: str, index: int, many: bool, multi_fmt: bool = False) -> Path:
+    """With several URLs, --out is a directory and files are named per KB."""
+    if not many:
+        return out.with_suffix(f".{fmt}") if multi_fmt else out
+    name = extract_kb_number(unquote(url)) or f"page_{index}"
+    return out / f"{name}.{fmt}"
+
+
+def capture_all(jobs, state_path: Path, viewport=(1366, 900), headless=True, workers=1, block_types=(),
+                profile_dir: Path | None = None, ready_selector=None):
+    """
+    Capture every (url, outputs) job. The sync Playwright API is bound to the
+    thread that started it, so each worker thread runs its own Capturer
+    (browser + page) and pulls URLs off a shared queue.
+    """
+    q = queue.Queue()
+    for job in jobs:
+        q.put(job)
+    failed = []
+
+    def worker(n):
+        # Chromium locks a user-data-dir, so every worker gets its own profile
+        profile = None
+        if profile_dir:
+            profile = profile_dir if n == 0 else profile_dir.with_name(f"{profile_dir.name}-{n}")
+        try:
+            with Capturer(state_path, viewport=viewport, headless=headless, block_types=block_types,
+                          profile_dir=profile, ready_selector=ready_selector) as cap:
+                while True:
+                    try:
+                        url, outputs = q.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        cap.capture(url, outputs)
+                    except Exception as e:
+                        print(f"[warn] Capture failed for {url}: {e}")
+                        failed.append(url)
+        except Exception as e:
+            # Launch / profile lock failed; the other workers keep draining the queue
+            print(f"[warn] Worker {n} could not start a browser: {e}")
+
+    n = max(1, min(workers, len(jobs)))
+    if n == 1:
+        worker(0)
+    else:
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    # Whatever is left had no live worker to take it (every browser failed to start)
+    while not q.empty():
+        failed.append(q.get_nowait()[0])
+    return failed
+
+
+def save_with_state(url: str, state_path: Path, out: Path, fmt: str, viewport=(1366, 900), headless=True):
+    with Capturer(state_path, viewport=viewport, headless=headless) as cap:
+        cap.capture(url, {fmt: out})
 
 
 def main():
@@ -210,29 +621,60 @@ def main():
     p_login.add_argument("--state", default="auth_state.json", help="Path to save Playwright storage state.")
     p_login.add_argument("--width", type=int, default=1366)
     p_login.add_argument("--height", type=int, default=900)
+    p_login.add_argument("--ready-url-contains", default="kb_view.do",
+                         help='Save once the browser lands on a non-login URL containing this; "" = press ENTER instead.')
+    p_login.add_argument("--ready-selector", default=None,
+                         help="Also wait for this CSS selector before saving the session.")
+    p_login.add_argument("--debug-screenshot", nargs="?", const="viewport", choices=["viewport", "full"],
+                         help="Save a JPEG next to the state file after login "
+                              "(full = whole page, written as tiles).")
 
     p_save = sub.add_parser("save", help="Use saved session state to fetch and save the page.")
-    p_save.add_argument("--url", required=True, help="Target KB URL.")
+    p_save.add_argument("--url", required=True, nargs="+", help="Target KB URL(s).")
     p_save.add_argument("--state", default="auth_state.json", help="Path to Playwright storage state (from login step).")
-    p_save.add_argument("--format", choices=["mhtml", "pdf", "html"], default="mhtml", help="Output format.")
-    p_save.add_argument("--out", required=True, help="Output file path, e.g., KB0010611.mhtml")
+    p_save.add_argument("--format", choices=["mhtml", "pdf", "html"], nargs="+", default=["mhtml"],
+                        help="Output format(s); several formats share one page load.")
+    p_save.add_argument("--out", required=True,
+                        help="Output file path, e.g., KB0010611.mhtml (a directory when several URLs are given)")
     p_save.add_argument("--width", type=int, default=1366)
     p_save.add_argument("--height", type=int, default=900)
     p_save.add_argument("--headful", action="store_true", help="Show browser window while saving (debug).")
+    p_save.add_argument("--profile", default=".pw-profile",
+                        help="Persistent Chromium profile dir (keeps HTTP cache; cookies seeded from --state).")
+    p_save.add_argument("--no-profile", action="store_true",
+                        help="Use a throwaway context built from --state instead of the persistent profile.")
+    p_save.add_argument("--no-images", action="store_true",
+                        help="Skip images/fonts/media for pdf output (ignored when mhtml is requested).")
+    p_save.add_argument("--ready-selector", default=None,
+                        help='CSS selector that marks the article as present, e.g. ".kb-article-body, article, #kb_article". '
+                             "Navigation then returns on commit and waits for it instead of domcontentloaded.")
+    p_save.add_argument("--workers", type=int, default=1,
+                        help="Parallel browsers when several URLs are given (4-8 is usually plenty).")
 
     args = parser.parse_args()
 
     if args.cmd == "login":
-        login_and_save_state(args.url, Path(args.state), viewport=(args.width, args.height))
+        if not login_and_save_state(args.url, Path(args.state), viewport=(args.width, args.height),
+                                    debug_screenshot=args.debug_screenshot,
+                                    ready_url_contains=args.ready_url_contains,
+                                    ready_selector=args.ready_selector):
+            sys.exit(1)
     elif args.cmd == "save":
-        save_with_state(
-            url=args.url,
-            state_path=Path(args.state),
-            out=Path(args.out),
-            fmt=args.format,
-            viewport=(args.width, args.height),
-            headless=(not args.headful),
-        )
+        out = Path(args.out)
+        many = len(args.url) > 1
+        multi_fmt = len(args.format) > 1
+        jobs = [
+            (url, {fmt: out_path_for(url, out, fmt, i, many, multi_fmt) for fmt in args.format})
+            for i, url in enumerate(args.url, start=1)
+        ]
+        failed = capture_all(jobs, Path(args.state), viewport=(args.width, args.height),
+                             headless=(not args.headful), workers=args.workers,
+                             block_types=blocked_types_for(args.format, args.no_images),
+                             profile_dir=None if args.no_profile else Path(args.profile),
+                             ready_selector=args.ready_selector)
+        if failed:
+            print(f"[warn] {len(failed)} of {len(jobs)} capture(s) failed.")
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -10,97 +10,203 @@ Fixes:
 """
 
 import argparse
+import base64
+import json
+import logging
+import queue
 import re
 import shutil
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from datetime import datetime
-from urllib.parse import unquote
+from urllib.parse import urlsplit
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 from playwright._impl._errors import Error as PlaywrightError
 
+from kb_common import decode_target_to_direct_url, extract_kb_number, looks_like_login, safe_filename, stamp
+
 
 DEFAULT_URL = "https://myservice.lloyds.com/now/nav/ui/classic/params/target/kb_view.do%3Fsysparm_article%3DKB0010611"
 
+# Per-phase budgets (ms); --timeout stays the overall cap for each
+NAV_BUDGET = 15_000
+CONTENT_BUDGET = 30_000
+SELECTOR_BUDGET = 15_000
+SAVE_BUDGET = 10_000
+
+# ServiceNow classic UI renders the article inside this iframe
+CONTENT_FRAME = "gsft_main"
+
+
+log = logging.getLogger("download_kb")
+
+
+def setup_logging(debug: bool) -> QueueListener:
+    """
+    Workers only enqueue records; one listener thread does the stdout writes,
+    so batch runs do not contend on the terminal.
+    """
+    records = queue.Queue(-1)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(records, handler)
+    log.addHandler(QueueHandler(records))
+    log.setLevel(logging.DEBUG if debug else logging.INFO)
+    log.propagate = False
+    listener.start()
+    return listener
+
 
-def stamp() -> str:
-    return datetime.now().strftime("%Y%m%d_%H%M%S")
+def set_phase_timeouts(page, args) -> None:
+    """Navigation and everything else (selectors, screenshots) get separate defaults."""
+    page.set_default_navigation_timeout(min(args.goto_timeout, args.timeout))
+    page.set_default_timeout(min(SELECTOR_BUDGET, args.timeout))
 
 
-def safe_filename(name: str, default: str = "page") -> str:
-    name = (name or "").strip() or default
-    name = re.sub(r"[^\w\-\.]+", "_", name)
-    return name[:180]
+def context_page(page, args):
+    """Another tab in the same context, set up like the main one."""
+    extra = page.context.new_page()
+    set_phase_timeouts(extra, args)
+    if args.debug:
+        attach_debug(extra)
+    return extra
 
 
-def looks_like_login(url: str) -> bool:
-    u = (url or "").lower()
-    return any(s in u for s in ("login", "sso", "saml", "auth", "okta", "adfs", "signin", "microsoftonline.com"))
+def attach_debug(page):
+    page.on("console", lambda msg: log.debug(f"[console] {msg.type}: {msg.text}"))
+    page.on("pageerror", lambda err: log.debug(f"[pageerror] {err}"))
+    page.on("requestfailed", lambda req: log.debug(f"[requestfailed] {req.url} -> {req.failure}"))
 
 
-def extract_kb_number(text: str) -> str | None:
-    m = re.search(r"(KB\d+)", text or "")
-    return m.group(1) if m else None
+LITE_BLOCK_TYPES = {"image", "media", "font", "websocket"}
 
 
-def decode_target_to_direct_url(url: str) -> str:
+def block_resources(context, types: set[str], keep: str = "") -> None:
     """
-    Converts:
-      .../target/kb_view.do%3Fsysparm_article%3DKB0010611
-    into:
-      https://<host>/kb_view.do?sysparm_article=KB0010611
+    Abort requests whose resource_type is in `types` (e.g. image, font, media,
+    stylesheet); URLs containing `keep` always go through.
     """
-    m = re.search(r"/target/([^?]+)", url)
-    if not m:
-        return url
-    encoded = m.group(1)
-    decoded = unquote(encoded)  # kb_view.do?sysparm_article=KB...
-    if decoded.startswith("http://") or decoded.startswith("https://"):
-        return decoded
-    host = re.match(r"^(https?://[^/]+)", url)
-    if not host:
-        return url
-    return f"{host.group(1)}/{decoded.lstrip('/')}"
+    if not types:
+        return
 
+    def handle(route):
+        req = route.request
+        if req.resource_type in types and not (keep and keep in req.url):
+            route.abort()
+        else:
+            route.continue_()
+
+    context.route("**/*", handle)
+
+
+# Installed once per document: window.__kbText is parsed and compiled one
+# time, so evaluates and wait predicates are just a call. A MutationObserver
+# keeps window.__kbTextLen current so the length waits read a number instead
+# of forcing innerText (style + layout) on every poll. class/style/hidden are
+# watched too: ServiceNow often reveals content already in the DOM by toggling them.
+PAGE_HELPERS_JS = """
+(() => {
+  window.__kbText = () => (document.body && document.body.innerText || '').trim();
+  let timer = null;
+  const measure = () => {
+    timer = null;
+    window.__kbTextLen = window.__kbText().length;
+  };
+  new MutationObserver(() => {
+    if (timer === null) timer = setTimeout(measure, 100);
+  }).observe(document, {
+    subtree: true, childList: true, characterData: true,
+    attributes: true, attributeFilter: ['class', 'style', 'hidden'],
+  });
+  document.addEventListener('DOMContentLoaded', measure);
+})();
+"""
 
-def attach_debug(page):
-    page.on("console", lambda msg: print(f"[console] {msg.type}: {msg.text}"))
-    page.on("pageerror", lambda err: print(f"[pageerror] {err}"))
-    page.on("requestfailed", lambda req: print(f"[requestfailed] {req.url} -> {req.failure}"))
+
+def install_page_helpers(context) -> None:
+    """Runs in every document the context opens, before the page's own scripts."""
+    context.add_init_script(PAGE_HELPERS_JS)
 
 
-def get_body_text(page) -> str:
+# Fallbacks cover documents opened before the helpers were installed
+_BODY_TEXT = "(window.__kbText ? window.__kbText() : (document.body && document.body.innerText || '').trim())"
+
+
+def get_body_text(page, max_chars: int | None = None) -> str:
+    # Sliced in the page so only max_chars cross CDP
     try:
-        return page.evaluate("() => (document.body && document.body.innerText || '').trim()")
+        return page.evaluate(
+            f"n => {{ const t = {_BODY_TEXT}; return n ? t.slice(0, n) : t; }}",
+            max_chars,
+        )
     except Exception:
         return ""
 
 
+def get_body_text_length(page) -> int:
+    """Length only; the full innerText is shipped once, at save time."""
+    try:
+        return page.evaluate(f"() => {_BODY_TEXT}.length")
+    except Exception:
+        return 0
+
+
 def wait_for_body_text_contains(page, needle: str, timeout_ms: int) -> bool:
-    deadline = time.time() + timeout_ms / 1000
+    # Same in-browser polling as wait_for_text_length
     needle = (needle or "").strip()
-    while time.time() < deadline:
-        txt = get_body_text(page)
-        if needle and needle in txt:
-            return True
-        time.sleep(0.25)
-    return False
+    if not needle:
+        # Nothing can match; don't sit out the whole timeout
+        return False
+    try:
+        page.wait_for_function(
+            f"n => {_BODY_TEXT}.includes(n)",
+            arg=needle,
+            polling=250,  # rAF polling would run innerText's layout every frame
+            timeout=timeout_ms,
+        )
+        return True
+    except PlaywrightError:
+        return False
 
 
 def wait_for_text_length(page, min_chars: int, timeout_ms: int) -> int:
-    deadline = time.time() + timeout_ms / 1000
-    last_len = 0
-    while time.time() < deadline:
-        txt = get_body_text(page)
-        last_len = len(txt)
-        if last_len >= min_chars:
-            return last_len
-        time.sleep(0.25)
-    return last_len
-
-
-def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attempts: int = 3) -> None:
+    # Predicate is polled inside the browser; one round-trip instead of one per 250ms
+    try:
+        page.wait_for_function(
+            f"n => (window.__kbTextLen ?? {_BODY_TEXT}.length) >= n",
+            arg=min_chars,
+            timeout=timeout_ms,
+        )
+    except PlaywrightError:
+        # Timeout, or the context was torn down by a late redirect
+        pass
+    return get_body_text_length(page)
+
+
+SSO_WAIT_MS = 600_000
+
+
+def wait_for_sso(page, manual: bool, prompt: str) -> None:
+    """
+    Block until the user has finished SSO in the headed window: the URL
+    leaving the login host wakes us immediately. `manual` keeps the ENTER prompt.
+    """
+    if manual:
+        input(prompt)
+        return
+    log.info("   Waiting for the browser to leave the login page...")
+    try:
+        page.wait_for_url(lambda u: not looks_like_login(u), timeout=SSO_WAIT_MS)
+    except PlaywrightTimeoutError:
+        log.warning("⚠️ Still on the login page after 10 minutes; continuing anyway.")
+
+
+def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attempts: int = 3,
+                        wait_until: str = "commit", manual_sso: bool = False) -> None:
     """
     Navigate to a URL and tolerate SSO interruptions.
     If Playwright reports navigation interrupted by another navigation (SSO redirect),
@@ -108,17 +214,18 @@ def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attem
     """
     for attempt in range(1, max_attempts + 1):
         try:
-            page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+            # Readiness is gated afterwards by the body-text waits
+            page.goto(url, wait_until=wait_until, timeout=timeout_ms)
             return
         except PlaywrightTimeoutError:
-            # Even if domcontentloaded times out, content may still be there
-            print(f"⚠️ goto timeout (attempt {attempt}/{max_attempts}). Continuing...")
+            # Expected with a short cap: content may still be arriving, the text waits take over
+            log.warning(f"⚠️ goto timeout (attempt {attempt}/{max_attempts}). Continuing...")
             return
         except PlaywrightError as e:
             msg = str(e)
             if "is interrupted by another navigation" in msg:
-                print(f"⚠️ Navigation interrupted by another navigation (SSO) (attempt {attempt}/{max_attempts}).")
-                print(f"   Current URL now: {page.url}")
+                log.warning(f"⚠️ Navigation interrupted by another navigation (SSO) (attempt {attempt}/{max_attempts}).")
+                log.info(f"   Current URL now: {page.url}")
 
                 # Give the automatic redirect a moment to complete
                 try:
@@ -126,14 +233,19 @@ def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attem
                 except Exception:
                     pass
 
+                if attempt == max_attempts:
+                    # No retry coming (e.g. --no-sso-retry); the caller's login check reports it
+                    return
+
                 if looks_like_login(page.url):
-                    print("🔐 Detected SSO/login page during navigation.")
+                    log.info("🔐 Detected SSO/login page during navigation.")
                     if not headed:
                         raise RuntimeError(
                             "SSO requires interaction but you are running headless. "
                             "Re-run with --headed."
                         )
-                    input("✅ Complete the SSO step in the browser window, then press ENTER to retry navigation...")
+                    wait_for_sso(page, manual_sso,
+                                 "✅ Complete the SSO step in the browser window, then press ENTER to retry navigation...")
 
                 # Retry after SSO settles
                 continue
@@ -142,71 +254,519 @@ def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attem
             raise
 
 
-def save_artifacts(page, out_dir: Path, base: str) -> None:
-    out_dir.mkdir(parents=True, exist_ok=True)
+def race_for_marker(pages: list, needle: str, timeout_ms: int, slice_ms: int = 250):
+    """First page whose body text contains `needle`, or None once timeout_ms runs out."""
+    deadline = time.monotonic() + timeout_ms / 1000
+    while time.monotonic() < deadline:
+        for p in pages:
+            if wait_for_body_text_contains(p, needle, timeout_ms=slice_ms):
+                return p
+    return None
 
-    png = out_dir / f"{base}.png"
-    html = out_dir / f"{base}.html"
-    final_url = out_dir / f"{base}.url.txt"
-    preview = out_dir / f"{base}.text_preview.txt"
 
+def page_outer_html(page) -> str:
+    """Serialized document via CDP DOM.getOuterHTML; page.content() if CDP is unavailable."""
     try:
-        page.screenshot(path=str(png), full_page=True)
-        print(f"✅ Screenshot: {png}")
-    except Exception as e:
-        print(f"⚠️ Screenshot failed: {e}")
+        cdp = page.context.new_cdp_session(page)
+        try:
+            root = cdp.send("DOM.getDocument", {"depth": 0})
+            return cdp.send("DOM.getOuterHTML", {"nodeId": root["root"]["nodeId"]})["outerHTML"]
+        finally:
+            cdp.detach()
+    except PlaywrightError:
+        return page.content()
 
+
+def _write_artifact(path: Path, data: bytes, label: str) -> None:
     try:
-        html.write_text(page.content(), encoding="utf-8")
-        print(f"✅ HTML: {html}")
+        path.write_bytes(data)
+        log.info(f"✅ {label}: {path}")
     except Exception as e:
-        print(f"⚠️ HTML save failed: {e}")
+        log.warning(f"⚠️ {label} save failed: {e}")
+
 
+def _write_b64_artifact(path: Path, data: str, label: str, chunk_chars: int = 64 * 1024) -> None:
+    """Decode base64 in slices straight into the file; no full-size decoded copy."""
     try:
-        final_url.write_text(page.url or "", encoding="utf-8")
-        print(f"✅ Final URL: {final_url}")
+        with open(path, "wb") as f:
+            for i in range(0, len(data), chunk_chars):
+                f.write(base64.b64decode(data[i:i + chunk_chars]))
+        log.info(f"✅ {label}: {path}")
     except Exception as e:
-        print(f"⚠️ URL save failed: {e}")
+        log.warning(f"⚠️ {label} save failed: {e}")
 
+
+def full_page_screenshot_b64(page, fmt: str = "png", quality: int = 70) -> str:
+    """Full-document image from CDP Page.captureScreenshot, still base64-encoded."""
+    cdp = page.context.new_cdp_session(page)
+    try:
+        m = cdp.send("Page.getLayoutMetrics")
+        size = m.get("cssContentSize") or m["contentSize"]
+        return cdp.send(
+            "Page.captureScreenshot",
+            {
+                "format": fmt,
+                **({"quality": quality} if fmt == "jpeg" else {}),
+                "captureBeyondViewport": True,
+                "clip": {"x": 0, "y": 0, "width": size["width"], "height": size["height"], "scale": 1},
+            },
+        )["data"]
+    finally:
+        cdp.detach()
+
+
+def save_frame_list(page, path: Path) -> None:
+    """Dump the page's iframes; one evaluate instead of walking page.frames over IPC."""
     try:
-        txt = get_body_text(page)
-        preview.write_text(txt[:12000], encoding="utf-8")
-        print(f"✅ Text preview: {preview}")
+        info = page.evaluate(
+            "() => Array.from(document.querySelectorAll('iframe'))"
+            ".map(f => ({name: f.name, id: f.id, src: f.src}))"
+        )
+        path.write_text("\n".join(f"name={i['name']!r} id={i['id']!r} src={i['src']}" for i in info), encoding="utf-8")
+        log.info(f"✅ Frame list ({len(info)}): {path}")
     except Exception as e:
-        print(f"⚠️ Text preview failed: {e}")
+        log.warning(f"⚠️ Frame list failed: {e}")
+
+
+# Outer document, content-frame document and texts in one round-trip.
+# contentDocument is null for cross-origin frames; those fields stay null.
+# withHtml=false sends the texts only (the MHTML snapshot already has the markup).
+# Texts are cut to previewChars in the page, not after the transfer.
+PREVIEW_CHARS = 12000
+PAGE_PAYLOAD_JS = """
+([frameName, withHtml, previewChars]) => {
+  const doc = d => (d.doctype ? new XMLSerializer().serializeToString(d.doctype) : "")
+                   + d.documentElement.outerHTML;
+  const text = d => (d.body && d.body.innerText || "").trim().slice(0, previewChars);
+  const f = document.querySelector(`iframe[name="${frameName}"]`);
+  let fd = null;
+  try { fd = f && f.contentDocument; } catch (e) { fd = null; }
+  return {
+    html: withHtml ? doc(document) : null,
+    text: text(document),
+    frameHtml: withHtml && fd && fd.documentElement ? doc(fd) : null,
+    frameText: fd ? text(fd) : null,
+  };
+}
+"""
 
 
-def main():
-    ap = argparse.ArgumentParser(description="Download ServiceNow KB page with SSO-friendly Playwright automation.")
-    ap.add_argument("--url", default=DEFAULT_URL, help="KB URL (nav wrapper or direct)")
-    ap.add_argument("--outdir", default="downloads", help="Output directory")
-    ap.add_argument("--profile-dir", default="pw_profile", help="Persistent browser profile directory")
-    ap.add_argument("--relogin", action="store_true", help="Delete profile dir and login again")
-    ap.add_argument("--headed", action="store_true", help="Visible browser window (recommended for SSO)")
-    ap.add_argument("--timeout", type=int, default=240_000, help="Timeout ms (default 240000)")
-    ap.add_argument("--min-chars", type=int, default=800, help="Minimum body text length to consider loaded")
-    ap.add_argument("--name", default="", help="Output base name (optional)")
-    ap.add_argument("--skip-direct", action="store_true", help="Do NOT navigate to decoded direct URL after login")
-    args = ap.parse_args()
+def page_payload(page, with_html: bool = True) -> dict:
+    try:
+        return page.evaluate(PAGE_PAYLOAD_JS, [CONTENT_FRAME, with_html, PREVIEW_CHARS])
+    except PlaywrightError:
+        # Fall back to separate calls (e.g. context torn down mid-evaluate)
+        html = page_outer_html(page) if with_html else None
+        return {"html": html, "text": get_body_text(page, PREVIEW_CHARS), "frameHtml": None, "frameText": None}
 
-    out_dir = Path(args.outdir)
+
+def page_mhtml(page) -> bytes:
+    """CDP Page.captureSnapshot: markup, frames and subresources in one file."""
+    cdp = page.context.new_cdp_session(page)
+    try:
+        data = cdp.send("Page.captureSnapshot", {"format": "mhtml"})["data"]
+    finally:
+        cdp.detach()
+    # MHTML is 7-bit (base64/quoted-printable parts); latin-1 is a straight copy
+    try:
+        return data.encode("latin-1")
+    except UnicodeEncodeError:
+        return data.encode("utf-8")
+
+
+def save_artifacts(page, out_dir: Path, base: str, screenshot: str = "viewport", shot_format: str = "jpeg",
+                   html_format: str = "mhtml", prefetched_html: bytes | None = None) -> None:
+    """
+    Browser round-trips (screenshot, MHTML snapshot, one fused evaluate) taken in turn,
+    since the sync API is single-threaded; every file write goes to a pool so
+    the writes overlap each other and the next round-trip. `prefetched_html`
+    (the captured KB response) is written as-is (.json for API bodies); with
+    --html-format html an HTML body stands in for the DOM serialization.
+    """
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    profile_dir = Path(args.profile_dir)
-    if args.relogin and profile_dir.exists():
-        print(f"🧹 Removing profile dir for relogin: {profile_dir}")
+    # JPEG encodes several times faster than PNG and is plenty for a debug image
+    shot = out_dir / f"{base}.{'jpg' if shot_format == 'jpeg' else 'png'}"
+    shot_opts = {"type": shot_format, **({"quality": 70} if shot_format == "jpeg" else {})}
+    html = out_dir / f"{base}.html"
+    mhtml = out_dir / f"{base}.mhtml"
+    final_url = out_dir / f"{base}.url.txt"
+    preview = out_dir / f"{base}.text_preview.txt"
+    frame_html = out_dir / f"{base}.frame.html"
+    frame_preview = out_dir / f"{base}.frame_text_preview.txt"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        # "full" re-lays out the whole document height; viewport is usually enough
+        if screenshot == "full":
+            # Large image: keep it base64 and decode in slices while writing
+            try:
+                pool.submit(_write_b64_artifact, shot, full_page_screenshot_b64(page, shot_format), "Screenshot")
+            except Exception as e:
+                log.warning(f"⚠️ Screenshot failed: {e}")
+        elif screenshot != "off":
+            try:
+                pool.submit(_write_artifact, shot, page.screenshot(timeout=SAVE_BUDGET, **shot_opts), "Screenshot")
+            except Exception as e:
+                log.warning(f"⚠️ Screenshot failed: {e}")
+
+        prefetched_json = prefetched_html is not None and prefetched_html.lstrip()[:1] in (b"{", b"[")
+        if prefetched_json:
+            pool.submit(_write_artifact, out_dir / f"{base}.json", prefetched_html, "JSON (KB response)")
+        elif prefetched_html is not None:
+            pool.submit(_write_artifact, html, prefetched_html, "HTML (KB response)")
+
+        with_html = html_format == "html" and (prefetched_html is None or prefetched_json)
+        if html_format == "mhtml":
+            try:
+                pool.submit(_write_artifact, mhtml, page_mhtml(page), "MHTML")
+            except Exception as e:
+                log.warning(f"⚠️ MHTML snapshot failed ({e}); saving plain HTML instead")
+                with_html = True
+
+        try:
+            payload = page_payload(page, with_html=with_html)
+        except Exception as e:
+            log.warning(f"⚠️ HTML save failed: {e}")
+            payload = None
+
+        if payload:
+            if payload["html"] is not None:
+                pool.submit(_write_artifact, html, payload["html"].encode("utf-8"), "HTML")
+            pool.submit(_write_artifact, preview, payload["text"].encode("utf-8"), "Text preview")
+            if payload["frameHtml"] is not None:
+                pool.submit(_write_artifact, frame_html, payload["frameHtml"].encode("utf-8"), "Frame HTML")
+            if payload["frameText"] is not None:
+                pool.submit(_write_artifact, frame_preview, payload["frameText"].encode("utf-8"),
+                            "Frame text preview")
+
+        pool.submit(_write_artifact, final_url, (page.url or "").encode("utf-8"), "Final URL")
+
+
+URL_CACHE_MAX_AGE_SEC = 7 * 24 * 3600
+
+
+def load_url_cache(path: Path) -> dict:
+    """{outer_url: {"inner": url, "ts": epoch}} of resolved gsft_main URLs; stale entries dropped."""
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {k: v for k, v in cache.items() if now - v.get("ts", 0) < URL_CACHE_MAX_AGE_SEC}
+
+
+def save_url_cache(path: Path, cache: dict) -> None:
+    try:
+        path.write_text(json.dumps(cache, indent=1), encoding="utf-8")
+    except OSError as e:
+        log.warning(f"⚠️ URL cache save failed: {e}")
+
+
+def remember_inner_url(page, url: str, url_cache: dict) -> None:
+    """Record where the content iframe actually lives, or forget it on a login bounce."""
+    if looks_like_login(page.url):
+        url_cache.pop(url, None)
+        return
+    # The direct-URL tab (usual race winner) has no content frame: it *is* the inner page
+    frame = page.frame(name=CONTENT_FRAME)
+    inner = frame.url if frame else page.url
+    if "/now/nav/ui" in inner:
+        return  # still the shell; its frame hasn't attached
+    if inner.startswith("http") and not looks_like_login(inner):
+        url_cache[url] = {"inner": inner, "ts": time.time()}
+
+
+def plan_targets(urls: list[str], name: str = "", url_cache: dict | None = None) -> list[dict]:
+    """
+    Resolve direct URL, KB number and artifact base name for every URL up
+    front, with one timestamp for the whole run. A cached inner frame URL
+    wins over the statically decoded one.
+    """
+    ts = stamp()
+    seen = {}
+    targets = []
+    for url in urls:
+        cached = (url_cache or {}).get(url)
+        direct_url = cached["inner"] if cached else decode_target_to_direct_url(url)
+        kb_number = extract_kb_number(direct_url) or extract_kb_number(url)
+        base_name = safe_filename(name if name.strip() else (extract_kb_number(url) or "KB"))
+        # Same KB twice in one run would overwrite; number the repeats
+        seen[base_name] = seen.get(base_name, 0) + 1
+        if seen[base_name] > 1:
+            base_name = f"{base_name}_{seen[base_name]}"
+        targets.append({"url": url, "direct_url": direct_url, "kb_number": kb_number, "base": f"{base_name}_{ts}"})
+    return targets
+
+
+# Responses that carry the article itself: the classic kb_view.do document, or
+# the knowledge APIs. Generic /api/now/ also serves every Polaris shell XHR.
+KB_RESPONSE_PATHS = ("/kb_view.do", "/api/now/table/kb_knowledge", "/api/sn_km_api/knowledge/")
+KB_RESPONSE_TYPES = {"document", "xhr", "fetch"}
+
+
+def response_kind(response) -> str:
+    """'html', 'json' or '' from the Content-Type header."""
+    ct = (response.headers.get("content-type") or "").lower()
+    if "html" in ct:
+        return "html"
+    if "json" in ct:
+        return "json"
+    return ""
+
+
+def is_kb_response(response) -> bool:
+    if not response.ok or response.request.resource_type not in KB_RESPONSE_TYPES:
+        return False
+    path = urlsplit(response.url).path
+    if "/now/nav/ui" in path or not any(p in path for p in KB_RESPONSE_PATHS):
+        return False  # the shell wrapper, or some other app call
+    kind = response_kind(response)
+    # The document must be the page itself; API calls must be JSON
+    return kind == "html" if path.endswith("/kb_view.do") else kind == "json"
+
+
+# Markup only the rendered article carries; the KB number alone is also in the
+# URL, form fields and scripts of "no access" and error pages
+KB_ARTICLE_MARKERS = ('id="kb_article"', "kb-article", "sn-kb-article", "knowledge-article", "<article")
+# Article body fields of the Table API (text) and the Knowledge API (content)
+KB_JSON_MARKERS = ('"text":', '"content":')
+_RE_SCRIPTS = re.compile(r"<(script|style)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+_RE_TAGS = re.compile(r"<[^>]+>")
+
+
+def markup_text_length(body: str) -> int:
+    """Rough visible-text length of an HTML/JSON body (scripts, styles and tags dropped)."""
+    return len("".join(_RE_TAGS.sub(" ", _RE_SCRIPTS.sub(" ", body)).split()))
+
+
+def kb_response_body(responses: list, kb_number: str | None, min_chars: int) -> str | None:
+    """First captured KB response whose body already holds the article."""
+    for response in responses:
+        try:
+            body = response.text()
+        except PlaywrightError:
+            continue
+        if kb_number and kb_number not in body:
+            continue
+        markers = KB_JSON_MARKERS if response_kind(response) == "json" else KB_ARTICLE_MARKERS
+        if any(m in body for m in markers) and markup_text_length(body) >= min_chars:
+            return body
+    return None
+
+
+def fetch_kb(page, target: dict, args, out_dir: Path, headed: bool, opened: bool = False) -> int:
+    """
+    Land on one KB article (a plan_targets entry), wait for its content and
+    save artifacts. `opened` means the page is already on the URL (the login
+    step). Returns the observed body text length.
+    """
+    url, direct_url, kb_number = target["url"], target["direct_url"], target["kb_number"]
+
+    log.info(f"Target URL:  {url}")
+    log.info(f"Direct URL:  {direct_url}")
+    log.info(f"KB number:   {kb_number}")
+
+    # Watch for the article's own response while navigating; reading it beats
+    # polling innerText when it arrives
+    kb_responses = []
+
+    def on_response(response):
+        if is_kb_response(response):
+            kb_responses.append(response)
+
+    # Context-level so the direct-URL race page is covered too
+    context = page.context
+    context.on("response", on_response)
+    side_pages = []
+    try:
+        return _fetch_kb(page, target, args, out_dir, headed, opened, kb_responses, side_pages)
+    finally:
+        context.remove_listener("response", on_response)
+        for p in side_pages:
+            p.close()
+
+
+def _fetch_kb(page, target: dict, args, out_dir: Path, headed: bool, opened: bool,
+              kb_responses: list, side_pages: list) -> int:
+    url, direct_url = target["url"], target["direct_url"]
+    kb_number, base = target["kb_number"], target["base"]
+    # goto only has to hand over a document; the text waits get their own budget
+    nav_timeout = min(args.goto_timeout, args.timeout)
+    content_timeout = min(args.budget_content, args.timeout)
+
+    # With --skip-outer the ServiceNow shell (nav wrapper) is never loaded
+    landed_direct = not opened and args.skip_outer
+    if not opened:
+        log.info("\n➡️ Opening URL...")
+        goto_with_sso_retry(page, direct_url if landed_direct else url, timeout_ms=nav_timeout,
+                            **args.nav_opts, headed=headed, wait_until=args.wait)
+
+    # 2) If KB already present, don’t re-navigate
+    if landed_direct:
+        pass
+    elif kb_number:
+        racers = [page]
+        if not args.skip_direct and direct_url != url:
+            # Cookies are shared, so load the direct URL in a second tab while
+            # the wrapper is still rendering and keep whichever shows the KB first
+            direct_page = context_page(page, args)
+            side_pages.append(direct_page)
+            goto_with_sso_retry(direct_page, direct_url, timeout_ms=nav_timeout, **args.nav_opts,
+                                headed=headed, wait_until="commit")
+            racers.append(direct_page)
+
+        log.info(f"\n⏳ Checking if KB marker ({kb_number}) is already present...")
+        winner = race_for_marker(racers, kb_number, timeout_ms=20_000)
+        if winner is page:
+            log.info("✅ KB marker already present; skipping direct navigation.")
+        elif winner is not None:
+            log.info("✅ KB marker showed up first on the direct URL; using that tab.")
+            page = winner
+        elif len(racers) > 1:
+            # 3) Neither tab has it yet; the direct one is already where step 3 would go
+            log.info("\n➡️ Continuing on the direct KB URL tab...")
+            page = racers[1]
+        elif not args.skip_direct:
+            log.info("\n➡️ Navigating to direct KB URL (SSO-safe)...")
+            goto_with_sso_retry(page, direct_url, timeout_ms=nav_timeout, **args.nav_opts,
+                                headed=headed, wait_until=args.wait)
+        else:
+            log.info("\nℹ️ --skip-direct set; not navigating to direct URL.")
+    else:
+        # If we can’t detect KB number, still attempt direct URL unless skipped
+        if not args.skip_direct and direct_url != url:
+            log.info("\n➡️ Navigating to direct URL (KB not detected in URL)...")
+            goto_with_sso_retry(page, direct_url, timeout_ms=nav_timeout, **args.nav_opts,
+                                headed=headed, wait_until=args.wait)
+
+    log.info(f"\n   Current URL: {page.url}")
+    if looks_like_login(page.url):
+        log.warning("⚠️ Still on SSO/login page. Session may not be established for the ServiceNow app.")
+        log.info("   Try --relogin and make sure you fully land on the KB page before pressing ENTER.")
+
+    # 4) Wait for content to appear; skipped when the KB response already arrived
+    body = kb_response_body(kb_responses, kb_number, args.min_chars)
+    if body is not None:
+        log.info("✅ KB response captured; skipping text polling.")
+        # The artifacts below still come from the live page; let it finish parsing
+        try:
+            page.wait_for_load_state("domcontentloaded", timeout=content_timeout)
+        except PlaywrightError:
+            pass
+        # Rendered text, not markup size, so the thin-content check below still means something
+        length = get_body_text_length(page)
+        log.info(f"   Observed text length: {length}")
+    else:
+        if kb_number:
+            log.info(f"⏳ Waiting for KB marker to appear in text: {kb_number}")
+            wait_for_body_text_contains(page, kb_number, timeout_ms=content_timeout)
+
+        log.info(f"⏳ Waiting for body text length >= {args.min_chars}")
+        length = wait_for_text_length(page, min_chars=args.min_chars, timeout_ms=content_timeout)
+        log.info(f"   Observed text length: {length}")
+
+    remember_inner_url(page, url, args.url_cache)
+
+    # 5) Save artifacts
+    log.info("\n💾 Saving artifacts...")
+    save_artifacts(page, out_dir, base, screenshot=args.screenshot, shot_format=args.screenshot_format,
+                   html_format=args.html_format,
+                   prefetched_html=body.encode("utf-8") if body is not None else None)
+    if args.debug_frames:
+        save_frame_list(page, out_dir / f"{base}.frames.txt")
+
+    if length < max(200, args.min_chars // 2):
+        log.warning("\n⚠️ Content still looks thin. Next step is to wait on a specific network response (XHR) that returns the KB JSON/HTML.")
+        log.info("   If you share the first 30 lines of the saved .text_preview.txt and the final URL, I’ll tailor that approach.")
+    return length
+
+
+def read_urls_file(path: Path) -> list[str]:
+    """One URL per line; blank lines and # comments are skipped."""
+    urls = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
+
+
+def state_page(browser, state: dict, args):
+    """
+    Page in a fresh context seeded with the signed-in cookies. Without the
+    shell there is nothing for outer-page JS to do, so --disable-outer-js
+    turns it off here.
+    """
+    context = browser.new_context(
+        storage_state=state,
+        viewport={"width": 1400, "height": 900},
+        java_script_enabled=not args.disable_outer_js,
+    )
+    block_resources(context, args.block_types, keep="/kb" if args.lite else "")
+    install_page_helpers(context)
+    page = context.new_page()
+    set_phase_timeouts(page, args)
+    return page
+
+
+def drain_jobs(page, jobs: queue.Queue, args, out_dir: Path, headed: bool) -> None:
+    while True:
+        try:
+            target = jobs.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            fetch_kb(page, target, args, out_dir, headed=headed)
+        except Exception as e:
+            log.error(f"❌ {target['url']}: {e}")
+
+
+def run_worker(jobs: queue.Queue, state: dict, args, out_dir: Path) -> None:
+    """
+    One browser per thread (sync Playwright objects are bound to the thread
+    that created them); cookies come from the signed-in profile.
+    """
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=(not args.headed))
+        page = state_page(browser, state, args)
+        # No interactive SSO from worker threads
+        drain_jobs(page, jobs, args, out_dir, headed=False)
+        page.context.close()
+        browser.close()
+
+
+def discard_profile(profile_dir: Path) -> None:
+    """
+    Rename the profile out of the way (instant on the same filesystem) and
+    delete it, plus any trash a previous run left behind, while Chromium starts.
+    """
+    trash = profile_dir.with_name(f".trash.{profile_dir.name}.{stamp()}")
+    try:
+        profile_dir.rename(trash)
+    except OSError:
         shutil.rmtree(profile_dir, ignore_errors=True)
+    for old in profile_dir.parent.glob(f".trash.{profile_dir.name}.*"):
+        threading.Thread(target=shutil.rmtree, args=(old,), kwargs={"ignore_errors": True}, daemon=True).start()
 
-    kb = extract_kb_number(args.url) or "KB"
-    base_name = safe_filename(args.name if args.name.strip() else kb)
-    base = f"{base_name}_{stamp()}"
 
-    direct_url = decode_target_to_direct_url(args.url)
-    kb_number = extract_kb_number(direct_url) or extract_kb_number(args.url)
+def run(args) -> None:
+    """Login once, then fetch every URL; main() only parses args and owns logging."""
+    out_dir = Path(args.outdir)
+    out_dir.mkdir(parents=True, exist_ok=True)
 
-    print(f"Target URL:  {args.url}")
-    print(f"Direct URL:  {direct_url}")
-    print(f"KB number:   {kb_number}")
+    profile_dir = Path(args.profile_dir)
+    if args.relogin and profile_dir.exists():
+        log.info(f"🧹 Removing profile dir for relogin: {profile_dir}")
+        discard_profile(profile_dir)
+
+    urls = read_urls_file(Path(args.urls_file)) if args.urls_file else [args.url]
+    if not urls:
+        raise SystemExit(f"No URLs found in {args.urls_file}")
+    url_cache_path = out_dir / ".url_cache.json"
+    args.url_cache = load_url_cache(url_cache_path)
+    # Shared goto_with_sso_retry options for every navigation in the run
+    args.nav_opts = {"max_attempts": 1 if args.no_sso_retry else 3, "manual_sso": args.manual_sso_confirm}
+    targets = plan_targets(urls, args.name if len(urls) == 1 else "", args.url_cache)
 
     with sync_playwright() as p:
         context = p.chromium.launch_persistent_context(
@@ -214,64 +774,116 @@ def main():
             headless=(not args.headed),
             viewport={"width": 1400, "height": 900},
         )
+        block_resources(context, args.block_types, keep="/kb" if args.lite else "")
+        install_page_helpers(context)
         page = context.new_page()
-        page.set_default_timeout(args.timeout)
-        attach_debug(page)
+        set_phase_timeouts(page, args)
+        if args.debug:
+            attach_debug(page)
 
         # 1) Open initial URL (may land on SSO)
-        print("\n➡️ Opening initial URL...")
-        goto_with_sso_retry(page, args.url, timeout_ms=args.timeout, headed=args.headed)
+        log.info("\n➡️ Opening initial URL...")
+        nav_timeout = min(args.goto_timeout, args.timeout)
+        goto_with_sso_retry(page, urls[0], timeout_ms=nav_timeout, **args.nav_opts,
+                            headed=args.headed, wait_until=args.wait)
 
         # If login page, user must complete it (headed required)
         if looks_like_login(page.url):
-            print(f"🔐 Login/SSO detected: {page.url}")
+            log.info(f"🔐 Login/SSO detected: {page.url}")
             if not args.headed:
                 context.close()
                 raise RuntimeError("You are headless but SSO requires interaction. Re-run with --headed.")
-            input("✅ Complete login in the browser window, then press ENTER here...")
-
-        # 2) If KB already present, don’t re-navigate
-        if kb_number:
-            print(f"\n⏳ Checking if KB marker ({kb_number}) is already present...")
-            if wait_for_body_text_contains(page, kb_number, timeout_ms=20_000):
-                print("✅ KB marker already present; skipping direct navigation.")
-            else:
-                # 3) Navigate to direct URL (but tolerate SSO interruptions)
-                if not args.skip_direct:
-                    print("\n➡️ Navigating to direct KB URL (SSO-safe)...")
-                    goto_with_sso_retry(page, direct_url, timeout_ms=args.timeout, headed=args.headed)
-                else:
-                    print("\nℹ️ --skip-direct set; not navigating to direct URL.")
-        else:
-            # If we can’t detect KB number, still attempt direct URL unless skipped
-            if not args.skip_direct and direct_url != args.url:
-                print("\n➡️ Navigating to direct URL (KB not detected in URL)...")
-                goto_with_sso_retry(page, direct_url, timeout_ms=args.timeout, headed=args.headed)
-
-        print(f"\n   Current URL: {page.url}")
-        if looks_like_login(page.url):
-            print("⚠️ Still on SSO/login page. Session may not be established for the ServiceNow app.")
-            print("   Try --relogin and make sure you fully land on the KB page before pressing ENTER.")
+            wait_for_sso(page, args.manual_sso_confirm, "✅ Complete login in the browser window, then press ENTER here...")
+
+        # The signed-in persistent context stays open for the whole run and
+        # works the queue itself; extra browsers only join for --max-concurrency
+        workers = max(1, min(args.max_concurrency, len(urls)))
+        jobs = queue.Queue()
+        for target in targets[1:]:
+            jobs.put(target)
+        threads = []
+        state = context.storage_state() if workers > 1 or args.disable_outer_js else None
+        if workers > 1:
+            log.info(f"\n🚀 Fetching {len(urls)} URLs with {workers} browsers...")
+            threads = [threading.Thread(target=run_worker, args=(jobs, state, args, out_dir))
+                       for _ in range(workers - 1)]
+            for t in threads:
+                t.start()
+
+        fetch_kb(page, targets[0], args, out_dir, headed=args.headed, opened=True)
+        nojs_browser = None
+        if args.disable_outer_js and not jobs.empty():
+            # The persistent context keeps JS for SSO; the rest of the queue runs JS-off
+            nojs_browser = p.chromium.launch(headless=(not args.headed))
+            page = state_page(nojs_browser, state, args)
+        drain_jobs(page, jobs, args, out_dir, headed=args.headed)
+
+        for t in threads:
+            t.join()
+        if nojs_browser is not None:
+            nojs_browser.close()
+        context.close()
 
-        # 4) Wait for content to appear
-        if kb_number:
-            print(f"⏳ Waiting for KB marker to appear in text: {kb_number}")
-            wait_for_body_text_contains(page, kb_number, timeout_ms=args.timeout)
+    save_url_cache(url_cache_path, args.url_cache)
+    log.info("\nDone.")
 
-        print(f"⏳ Waiting for body text length >= {args.min_chars}")
-        length = wait_for_text_length(page, min_chars=args.min_chars, timeout_ms=args.timeout)
-        print(f"   Observed text length: {length}")
 
-        # 5) Save artifacts
-        print("\n💾 Saving artifacts...")
-        save_artifacts(page, out_dir, base)
 
-        if length < max(200, args.min_chars // 2):
-            print("\n⚠️ Content still looks thin. Next step is to wait on a specific network response (XHR) that returns the KB JSON/HTML.")
-            print("   If you share the first 30 lines of the saved .text_preview.txt and the final URL, I’ll tailor that approach.")
+def main():
+    ap = argparse.ArgumentParser(description="Download ServiceNow KB page with SSO-friendly Playwright automation.")
+    ap.add_argument("--url", default=DEFAULT_URL, help="KB URL (nav wrapper or direct)")
+    ap.add_argument("--urls-file", default="", help="Text file with one KB URL per line (overrides --url)")
+    ap.add_argument("--max-concurrency", type=int, default=1,
+                    help="Parallel browsers for --urls-file after login (default 1)")
+    ap.add_argument("--outdir", default="downloads", help="Output directory")
+    ap.add_argument("--profile-dir", default="pw_profile", help="Persistent browser profile directory")
+    ap.add_argument("--relogin", action="store_true", help="Delete profile dir and login again")
+    ap.add_argument("--headed", action="store_true", help="Visible browser window (recommended for SSO)")
+    ap.add_argument("--timeout", type=int, default=240_000, help="Overall cap on any single wait in ms (default 240000)")
+    ap.add_argument("--goto-timeout", type=int, default=NAV_BUDGET,
+                    help="Cap on each page.goto in ms; a timeout here is expected and not fatal (default 15000)")
+    ap.add_argument("--budget-content", type=int, default=CONTENT_BUDGET,
+                    help="Budget in ms for each content wait (KB marker, text length) (default 30000)")
+    ap.add_argument("--wait", choices=["commit", "domcontentloaded", "load"], default="commit",
+                    help="page.goto wait_until (default commit; body-text waits gate readiness)")
+    ap.add_argument("--min-chars", type=int, default=800, help="Minimum body text length to consider loaded")
+    ap.add_argument("--name", default="", help="Output base name (optional, single URL only)")
+    ap.add_argument("--screenshot", choices=["off", "viewport", "full"], default="viewport",
+                    help="Screenshot mode (default viewport)")
+    ap.add_argument("--screenshot-format", choices=["jpeg", "png"], default="jpeg",
+                    help="Screenshot encoding (default jpeg, quality 70)")
+    ap.add_argument("--full-page", dest="screenshot", action="store_const", const="full",
+                    help="Alias for --screenshot full")
+    ap.add_argument("--html-format", choices=["mhtml", "html"], default="mhtml",
+                    help="mhtml: CDP snapshot incl. frames and resources (default); html: serialized DOM")
+    ap.add_argument("--block-resources", default="font,media",
+                    help="Comma-separated resource types to abort, e.g. image,font,media,stylesheet "
+                         "(default font,media keeps the screenshot faithful; '' blocks nothing)")
+    ap.add_argument("--lite", action="store_true",
+                    help="Also block images, fonts, media and websockets (except /kb URLs); faster, plainer screenshot")
+    ap.add_argument("--debug", action="store_true", help="Log page console/pageerror/requestfailed events")
+    ap.add_argument("--debug-frames", action="store_true", help="Also save the list of iframes (name/id/src)")
+    ap.add_argument("--skip-outer", action="store_true",
+                    help="After login, open each KB's decoded direct URL straight away instead of the nav wrapper")
+    ap.add_argument("--disable-outer-js", action="store_true",
+                    help="Fetch every KB after the login one with JavaScript off; implies --skip-outer")
+    ap.add_argument("--manual-sso-confirm", action="store_true",
+                    help="Press ENTER after SSO instead of waiting for the URL to leave the login page")
+    ap.add_argument("--no-sso-retry", action="store_true",
+                    help="Single plain navigation; don't wait out and retry SSO-interrupted gotos")
+    ap.add_argument("--skip-direct", action="store_true", help="Do NOT navigate to decoded direct URL after login")
+    args = ap.parse_args()
+    args.block_types = {t.strip() for t in args.block_resources.split(",") if t.strip()}
+    if args.lite:
+        args.block_types |= LITE_BLOCK_TYPES
+    if args.disable_outer_js:
+        args.skip_outer = True
 
-        context.close()
-        print("\nDone.")
+    listener = setup_logging(args.debug)
+    try:
+        run(args)
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
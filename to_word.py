@@ -1,58 +1,56 @@
 #!/usr/bin/env python3
 import argparse
+import gc
 import re
 import shutil
-import time
+import zipfile
 from pathlib import Path
-from datetime import datetime
-from urllib.parse import unquote
+from xml.sax.saxutils import escape as xml_escape
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 from playwright._impl._errors import Error as PlaywrightError
 
-from bs4 import BeautifulSoup
+from kb_common import decode_target_to_direct_url, extract_kb_number, looks_like_login, safe_filename, stamp
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+import docx
 from docx import Document
 from docx.shared import Pt
+from lxml import etree
 
-
-DEFAULT_URL = "https://myservice.lloyds.com/now/nav/ui/classic/params/target/kb_view.do%3Fsysparm_article%3DKB0010611"
-
-
-def stamp() -> str:
-    return datetime.now().strftime("%Y%m%d_%H%M%S")
-
-
-def safe_filename(name: str, default: str = "page") -> str:
-    name = (name or "").strip() or default
-    name = re.sub(r"[^\w\-\.]+", "_", name)
-    return name[:180]
-
-
-def looks_like_login(url: str) -> bool:
-    u = (url or "").lower()
-    return any(s in u for s in ("login", "sso", "saml", "auth", "okta", "adfs", "signin", "microsoftonline.com"))
+# Optional: selectolax parses/selects ~10x faster than BS4 for container picking
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
 
 
-def extract_kb_number(text: str) -> str | None:
-    m = re.search(r"(KB\d+)", text or "")
-    return m.group(1) if m else None
+DEFAULT_URL = "https://myservice.lloyds.com/now/nav/ui/classic/params/target/kb_view.do%3Fsysparm_article%3DKB0010611"
 
+# Trim subsystems a single-article export never uses (faster launch, less RSS).
+# --single-process/--no-zygote are left out: they crash Chromium under load.
+LAUNCH_ARGS = [
+    "--disable-gpu",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-features=Translate,BackForwardCache,InterestCohort",
+    # Text-only export: skip downloading images (the archive screenshot shows placeholders)
+    "--blink-settings=imagesEnabled=false",
+]
 
-def decode_target_to_direct_url(url: str) -> str:
-    m = re.search(r"/target/([^?]+)", url)
-    if not m:
-        return url
-    encoded = m.group(1)
-    decoded = unquote(encoded)
-    if decoded.startswith("http://") or decoded.startswith("https://"):
-        return decoded
-    host = re.match(r"^(https?://[^/]+)", url)
-    if not host:
-        return url
-    return f"{host.group(1)}/{decoded.lstrip('/')}"
+_RE_BULLET = re.compile(r"^(\-|\*|•)\s+")
+_RE_NUMBERED = re.compile(r"^\d+[\.\)]\s+")
+# Control characters XML 1.0 can't carry
+_RE_XML_BAD = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
 
 
-def attach_debug(page):
+def attach_debug(page, verbose: bool = False):
+    # Unregistered listeners mean Playwright never marshals the events at all
+    if not verbose:
+        return
     page.on("console", lambda msg: print(f"[console] {msg.type}: {msg.text}"))
     page.on("pageerror", lambda err: print(f"[pageerror] {err}"))
     page.on("requestfailed", lambda req: print(f"[requestfailed] {req.url} -> {req.failure}"))
@@ -66,21 +64,26 @@ def get_body_text(page) -> str:
 
 
 def wait_for_text_length(page, min_chars: int, timeout_ms: int) -> int:
-    deadline = time.time() + timeout_ms / 1000
-    last_len = 0
-    while time.time() < deadline:
-        txt = get_body_text(page)
-        last_len = len(txt)
-        if last_len >= min_chars:
-            return last_len
-        time.sleep(0.25)
-    return last_len
-
-
-def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attempts: int = 3) -> None:
+    # Predicate is polled inside the browser; one round-trip instead of one per 250ms.
+    # Same 250ms cadence: the default rAF polling would force innerText's layout every frame
+    try:
+        page.wait_for_function(
+            "n => (document.body && document.body.innerText || '').trim().length >= n",
+            arg=min_chars,
+            polling=250,
+            timeout=timeout_ms,
+        )
+    except PlaywrightError:
+        # Timeout, or the context was torn down by a late redirect
+        pass
+    return len(get_body_text(page))
+
+
+def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attempts: int = 3,
+                        wait_until: str = "domcontentloaded") -> None:
     for attempt in range(1, max_attempts + 1):
         try:
-            page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+            page.goto(url, wait_until=wait_until, timeout=timeout_ms)
             return
         except PlaywrightTimeoutError:
             print(f"⚠️ goto timeout (attempt {attempt}/{max_attempts}). Continuing...")
@@ -115,15 +118,39 @@ USELESS_SELECTORS = [
     ".sidebar", ".side-nav", ".toc", ".breadcrumbs",
     ".sn-viewport", ".sn-polaris-layout",  # sometimes large wrappers
 ]
+# Common candidates for KB/article pages (ServiceNow & generic)
+CANDIDATE_SELECTORS = [
+    "article",
+    "main",
+    "#kb_article",
+    ".kb-article",
+    ".kb-article-content",
+    ".kb-view",
+    ".sn-kb-article",
+    ".knowledge-article",
+    "[data-testid*='article']",
+    "[id*='kb']",
+    "[class*='kb']",
+    "[class*='article']",
+    "[class*='content']",
+]
+
+# Parse each selector list once and match in a single tree walk
+_USELESS_COMPOUND = ", ".join(
+    sorted(USELESS_TAGS) + USELESS_SELECTORS + [f"[role='{r}']" for r in sorted(USELESS_ROLES)]
+)
+_CANDIDATE_COMPOUND = ", ".join(CANDIDATE_SELECTORS)
 
 
 def normalize_lines(text: str) -> list[str]:
     # Keep meaningful lines, collapse whitespace
     lines = []
     for raw in text.splitlines():
-        line = re.sub(r"\s+", " ", raw).strip()
-        if not line:
+        # str.split() collapses any whitespace run in C
+        parts = raw.split()
+        if not parts:
             continue
+        line = " ".join(parts)
         # drop obvious “chrome” lines (tweak if needed)
         if line.lower() in {"search", "home"}:
             continue
@@ -131,63 +158,94 @@ def normalize_lines(text: str) -> list[str]:
     return lines
 
 
-def soup_remove_useless(soup: BeautifulSoup) -> None:
-    # Remove tag types
-    for t in list(soup.find_all(list(USELESS_TAGS))):
-        t.decompose()
+# Pick the main container in the page and ship only that subtree (plus the
+# title) instead of the whole serialized DOM; chrome areas are skipped.
+MAIN_HTML_JS = """(cfg) => {
+    const textLen = (n) => (n.innerText || '').trim().length;
+    let best = null, bestLen = 0;
+    const scan = (sel) => {
+        for (const n of document.querySelectorAll(sel)) {
+            if (n.closest(cfg.useless)) continue;
+            const l = textLen(n);
+            if (l > bestLen) { bestLen = l; best = n; }
+        }
+    };
+    scan(cfg.candidates);
+    if (!(best && bestLen >= 400)) scan('div, section, article, main');
+    best = best || document.body;
+    if (!best) return document.documentElement.outerHTML;
+    const d = document.implementation.createHTMLDocument(document.title);
+    d.body.appendChild(d.importNode(best, true));
+    return d.documentElement.outerHTML;
+}"""
+
+
+def page_main_html(page) -> str:
+    """Main-container HTML for extraction; the full page.content() if the in-page pick fails."""
+    try:
+        return page.evaluate(MAIN_HTML_JS, {"candidates": _CANDIDATE_COMPOUND, "useless": _USELESS_COMPOUND})
+    except PlaywrightError:
+        return page.content()
 
-    # Remove typical chrome areas
-    for sel in USELESS_SELECTORS:
-        for t in soup.select(sel):
-            t.decompose()
 
-    # Remove by role
-    for role in USELESS_ROLES:
-        for t in soup.select(f"[role='{role}']"):
+def soup_remove_useless(soup: BeautifulSoup) -> None:
+    # One select over the joined list instead of a tree walk per selector;
+    # matches nested in an already-removed block are skipped
+    for t in soup.select(_USELESS_COMPOUND):
+        if not t.decomposed:
             t.decompose()
 
 
+def text_lengths(root) -> dict[int, int]:
+    """
+    len(tag.get_text("\n", strip=True)) for every tag under root, in one pass:
+    walking in reverse document order, a tag's descendants are already summed.
+    """
+    acc: dict[int, list[int]] = {}  # id(tag) -> [chars, non-empty strings]
+    lengths: dict[int, int] = {}
+    for node in reversed(list(root.descendants)):
+        if isinstance(node, Tag):
+            chars, pieces = acc.pop(id(node), (0, 0))
+            lengths[id(node)] = chars + max(pieces - 1, 0)  # "\n" between pieces
+        elif type(node) in (NavigableString, CData):
+            s = node.strip()
+            if not s:
+                continue
+            chars, pieces = len(s), 1
+        else:
+            continue  # comments, doctype, ...
+        a = acc.setdefault(id(node.parent), [0, 0])
+        a[0] += chars
+        a[1] += pieces
+    return lengths
+
+
 def pick_best_container(soup: BeautifulSoup) -> BeautifulSoup:
     """
     Try common main-content containers first; fallback to the biggest text block.
     """
-    # Common candidates for KB/article pages (ServiceNow & generic)
-    candidate_selectors = [
-        "article",
-        "main",
-        "#kb_article",
-        ".kb-article",
-        ".kb-article-content",
-        ".kb-view",
-        ".sn-kb-article",
-        ".knowledge-article",
-        "[data-testid*='article']",
-        "[id*='kb']",
-        "[class*='kb']",
-        "[class*='article']",
-        "[class*='content']",
-    ]
-
+    # Candidate sets overlap heavily; every tag's text length comes from one walk
+    lengths = text_lengths(soup)
     best_node = None
     best_len = 0
 
     # 1) Try known selectors
-    for sel in candidate_selectors:
-        for node in soup.select(sel):
-            txt = node.get_text("\n", strip=True)
-            ln = len(txt)
-            if ln > best_len:
-                best_len = ln
-                best_node = node
+    # One select over the joined list instead of a tree walk per selector
+    for node in soup.select(_CANDIDATE_COMPOUND):
+        ln = lengths[id(node)]
+        if ln > best_len:
+            best_len = ln
+            best_node = node
 
     if best_node and best_len >= 400:
         return best_node
 
     # 2) Fallback: choose the element with the largest text density
     # (avoid picking body if it’s mostly chrome by stripping first)
-    for node in soup.find_all(["div", "section", "article", "main"], recursive=True):
-        txt = node.get_text("\n", strip=True)
-        ln = len(txt)
+    for node in soup.descendants:
+        if not isinstance(node, Tag) or node.name not in ("div", "section", "article", "main"):
+            continue
+        ln = lengths[id(node)]
         if ln > best_len:
             best_len = ln
             best_node = node
@@ -195,6 +253,40 @@ def pick_best_container(soup: BeautifulSoup) -> BeautifulSoup:
     return best_node if best_node else soup.body or soup
 
 
+def _extract_main_text_fast(html: str) -> tuple[str, str]:
+    """
+    Same heuristics as the BS4 path, but parse/clean/select in selectolax (C).
+    Returns (title, raw container text).
+    """
+    tree = HTMLParser(html)
+    title_node = tree.css_first("title")
+    title = title_node.text(strip=True) if title_node else ""
+
+    # Reverse document order: descendants go before their ancestors are freed
+    for t in reversed(tree.css(_USELESS_COMPOUND)):
+        t.decompose()
+
+    best_node = None
+    best_len = 0
+
+    for node in tree.css(_CANDIDATE_COMPOUND):
+        ln = len(node.text(deep=True, separator="\n", strip=True))
+        if ln > best_len:
+            best_len = ln
+            best_node = node
+
+    if not (best_node and best_len >= 400):
+        for node in tree.css("div, section, article, main"):
+            ln = len(node.text(deep=True, separator="\n", strip=True))
+            if ln > best_len:
+                best_len = ln
+                best_node = node
+
+    best_node = best_node or tree.body or tree.root
+    raw_text = best_node.text(deep=True, separator="\n", strip=True) if best_node else ""
+    return title, raw_text
+
+
 def extract_main_text_from_html(html: str) -> tuple[str, str]:
     """
     Returns (title, main_text).
@@ -212,6 +304,16 @@ def extract_main_text_from_html(html: str) -> tuple[str, str]:
     except Exception:
         extracted = None
 
+    if extracted:
+        # Only the title is still needed; a bare lxml parse, no cleanup or container pick
+        root = etree.HTML(html)
+        title = (root.findtext(".//title") or "").strip() if root is not None else ""
+        return title, extracted.strip()
+
+    if HTMLParser is not None:
+        title, raw_text = _extract_main_text_fast(html)
+        return title, "\n".join(normalize_lines(raw_text)).strip()
+
     soup = BeautifulSoup(html, "lxml")
     title = ""
     if soup.title and soup.title.get_text(strip=True):
@@ -219,10 +321,6 @@ def extract_main_text_from_html(html: str) -> tuple[str, str]:
 
     soup_remove_useless(soup)
 
-    if extracted:
-        main_text = extracted.strip()
-        return title, main_text
-
     container = pick_best_container(soup)
     raw_text = container.get_text("\n", strip=True)
     lines = normalize_lines(raw_text)
@@ -234,7 +332,73 @@ def extract_main_text_from_html(html: str) -> tuple[str, str]:
 # WORD OUTPUT
 # -----------------------------
 
+def docx_blocks(title: str, main_text: str, source_url: str) -> list[tuple[str | None, str]]:
+    """(style id, text) per paragraph; style None is Normal."""
+    blocks = [("Heading1", title or "Knowledge Article"), (None, f"Source: {source_url}"), (None, "")]
+
+    # Preserve simple structure: paragraphs and bullets
+    for line in main_text.splitlines():
+        l = line.strip()
+        if not l:
+            continue
+
+        # Basic bullet detection
+        bullet = _RE_BULLET.match(l)
+        numbered = None if bullet else _RE_NUMBERED.match(l)
+        if bullet:
+            blocks.append(("ListBullet", l[bullet.end():]))
+        elif numbered:
+            blocks.append(("ListNumber", l[numbered.end():]))
+        elif len(l) <= 80 and (l.isupper() or l.endswith(":")):
+            # Heading-ish heuristic
+            blocks.append(("Heading2", l.rstrip(":")))
+        else:
+            blocks.append((None, l))
+    return blocks
+
+
+# python-docx's own blank template: styles, numbering and page setup
+DOCX_TEMPLATE = Path(docx.__file__).parent / "templates" / "default.docx"
+# Same look as setting Normal to Calibri 11pt, applied per run
+_BODY_RPR = '<w:rPr><w:rFonts w:ascii="Calibri" w:hAnsi="Calibri"/><w:sz w:val="22"/></w:rPr>'
+
+
+def _docx_paragraph(style: str | None, text: str) -> str:
+    text = xml_escape(_RE_XML_BAD.sub("", text))
+    ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    rpr = "" if style and style.startswith("Heading") else _BODY_RPR
+    if not text:
+        return f"<w:p>{ppr}</w:p>"
+    return f'<w:p>{ppr}<w:r>{rpr}<w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+
+def write_docx_direct(docx_path: Path, blocks: list[tuple[str | None, str]]) -> None:
+    """
+    Copy the template package and write word/document.xml as one string;
+    no python-docx object tree per paragraph.
+    """
+    with zipfile.ZipFile(DOCX_TEMPLATE) as tpl:
+        doc_xml = tpl.read("word/document.xml").decode("utf-8")
+        # Keep the template's root (namespaces) and section properties, replace the body
+        head = doc_xml[:doc_xml.index("<w:body>") + len("<w:body>")]
+        tail = doc_xml[doc_xml.index("<w:sectPr"):]
+        body = "".join(_docx_paragraph(style, text) for style, text in blocks)
+        with zipfile.ZipFile(docx_path, "w", zipfile.ZIP_DEFLATED) as out:
+            for item in tpl.infolist():
+                if item.filename == "word/document.xml":
+                    out.writestr(item.filename, head + body + tail)
+                else:
+                    out.writestr(item, tpl.read(item.filename))
+
+
 def save_to_docx(docx_path: Path, title: str, main_text: str, source_url: str) -> None:
+    blocks = docx_blocks(title, main_text, source_url)
+    docx_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if DOCX_TEMPLATE.exists():
+        write_docx_direct(docx_path, blocks)
+        return
+
     doc = Document()
 
     # Basic styling
@@ -242,40 +406,99 @@ def save_to_docx(docx_path: Path, title: str, main_text: str, source_url: str) -
     style.font.name = "Calibri"
     style.font.size = Pt(11)
 
-    if title:
-        doc.add_heading(title, level=1)
-    else:
-        doc.add_heading("Knowledge Article", level=1)
+    for style_id, text in blocks:
+        if style_id in ("Heading1", "Heading2"):
+            doc.add_heading(text, level=int(style_id[-1]))
+        elif style_id == "ListBullet":
+            doc.add_paragraph(text, style="List Bullet")
+        elif style_id == "ListNumber":
+            doc.add_paragraph(text, style="List Number")
+        else:
+            doc.add_paragraph(text)
 
-    doc.add_paragraph(f"Source: {source_url}")
+    doc.save(str(docx_path))
+    # python-docx's element tree is full of parent links; free it now rather than
+    # letting it pile up across a --urls-file batch
+    del doc
+    gc.collect()
 
-    doc.add_paragraph("")  # spacer
 
-    # Preserve simple structure: paragraphs and bullets
-    for line in main_text.splitlines():
-        l = line.strip()
-        if not l:
-            continue
+def read_urls_file(path: Path) -> list[str]:
+    """One URL per line; blank lines and # comments are skipped."""
+    urls = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
 
-        # Basic bullet detection
-        if re.match(r"^(\-|\*|•)\s+", l):
-            doc.add_paragraph(re.sub(r"^(\-|\*|•)\s+", "", l), style="List Bullet")
-        elif re.match(r"^\d+[\.\)]\s+", l):
-            doc.add_paragraph(re.sub(r"^\d+[\.\)]\s+", "", l), style="List Number")
-        else:
-            # Heading-ish heuristic
-            if len(l) <= 80 and (l.isupper() or l.endswith(":")):
-                doc.add_heading(l.rstrip(":"), level=2)
-            else:
-                doc.add_paragraph(l)
 
-    docx_path.parent.mkdir(parents=True, exist_ok=True)
-    doc.save(str(docx_path))
+def export_kb(page, url: str, args, out_dir: Path, first: bool, single: bool) -> None:
+    """
+    Navigate to one KB and write its artifacts. Only the first URL goes
+    through the nav wrapper and SSO; later ones reuse the signed-in context.
+    """
+    direct_url = decode_target_to_direct_url(url)
+    kb = extract_kb_number(direct_url) or extract_kb_number(url) or "KB"
+    base_name = safe_filename(args.name if single and args.name.strip() else kb)
+    base = f"{base_name}_{stamp()}"
+
+    if first or args.skip_direct:
+        # Open initial URL
+        print("➡️ Opening initial URL...")
+        # The wrapper usually bounces straight to SSO; no point waiting for its DOMContentLoaded
+        goto_with_sso_retry(page, url, timeout_ms=args.timeout, headed=args.headed, wait_until="commit")
+
+        # Manual SSO if needed
+        if looks_like_login(page.url):
+            if not args.headed:
+                raise RuntimeError("SSO requires interaction. Re-run with --headed.")
+            input("✅ Complete SSO in the browser, then press ENTER here...")
+
+    # Navigate to direct KB URL unless skipped
+    if not args.skip_direct:
+        print("➡️ Navigating to direct KB URL...")
+        goto_with_sso_retry(page, direct_url, timeout_ms=args.timeout, headed=args.headed)
+
+    # Wait for content
+    print(f"⏳ Waiting for body text length >= {args.min_chars}")
+    length = wait_for_text_length(page, min_chars=args.min_chars, timeout_ms=args.timeout)
+    print(f"   Observed text length: {length}")
+
+    # Save raw HTML + screenshot (debug only; a full-page capture is the slowest step)
+    jpg_path = out_dir / f"{base}.jpg"
+    html_path = out_dir / f"{base}.html"
+    if args.screenshot:
+        try:
+            page.screenshot(path=str(jpg_path), full_page=True, type="jpeg", quality=70)
+            print(f"✅ Screenshot: {jpg_path}")
+        except Exception as e:
+            print(f"⚠️ Screenshot failed: {e}")
+
+    if not args.no_html:
+        html = page.content()
+        html_path.write_bytes(html.encode("utf-8"))
+        print(f"✅ HTML: {html_path}")
+
+    # NEW: Extract main content and write Word file
+    if args.docx:
+        title, main_text = extract_main_text_from_html(page_main_html(page))
+
+        if not main_text or len(main_text) < 200:
+            print("⚠️ Main content extraction produced little text.")
+            print("   Tip: the page may be mostly dynamic; increase --timeout or --min-chars, or share HTML for selector tuning.")
+
+        docx_filename = (args.docx_name.strip() if single else "") or f"{base}.docx"
+        docx_path = out_dir / safe_filename(docx_filename, default=f"{base}.docx")
+        save_to_docx(docx_path, title=title, main_text=main_text, source_url=page.url)
+
+        print(f"✅ Word saved: {docx_path}")
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--url", default=DEFAULT_URL)
+    ap.add_argument("--urls-file", default="", help="Text file with one KB URL per line (overrides --url)")
     ap.add_argument("--outdir", default="downloads")
     ap.add_argument("--profile-dir", default="pw_profile")
     ap.add_argument("--relogin", action="store_true")
@@ -290,6 +513,9 @@ def main():
 
     # Sometimes the nav wrapper works better; keep option
     ap.add_argument("--skip-direct", action="store_true")
+    ap.add_argument("--screenshot", action="store_true", help="Save a full-page JPEG screenshot (debugging)")
+    ap.add_argument("--no-html", action="store_true", help="Don't archive the full page HTML (skips page.content())")
+    ap.add_argument("--verbose", action="store_true", help="Verbose Playwright console/request logging")
 
     args = ap.parse_args()
 
@@ -301,70 +527,42 @@ def main():
         print(f"🧹 Removing profile dir for relogin: {profile_dir}")
         shutil.rmtree(profile_dir, ignore_errors=True)
 
-    direct_url = decode_target_to_direct_url(args.url)
-    kb = extract_kb_number(direct_url) or extract_kb_number(args.url) or "KB"
-    base_name = safe_filename(args.name if args.name.strip() else kb)
-    base = f"{base_name}_{stamp()}"
+    urls = read_urls_file(Path(args.urls_file)) if args.urls_file else [args.url]
+    if not urls:
+        raise SystemExit(f"No URLs found in {args.urls_file}")
 
+    # One browser and one signed-in page for the whole batch
     with sync_playwright() as p:
         context = p.chromium.launch_persistent_context(
             user_data_dir=str(profile_dir),
             headless=(not args.headed),
             viewport={"width": 1400, "height": 900},
+            args=LAUNCH_ARGS,
+            ignore_default_args=["--enable-automation"],
         )
         page = context.new_page()
         page.set_default_timeout(args.timeout)
-        attach_debug(page)
-
-        # Open initial URL
-        print("➡️ Opening initial URL...")
-        goto_with_sso_retry(page, args.url, timeout_ms=args.timeout, headed=args.headed)
-
-        # Manual SSO if needed
-        if looks_like_login(page.url):
-            if not args.headed:
-                context.close()
-                raise RuntimeError("SSO requires interaction. Re-run with --headed.")
-            input("✅ Complete SSO in the browser, then press ENTER here...")
-
-        # Navigate to direct KB URL unless skipped
-        if not args.skip_direct:
-            print("➡️ Navigating to direct KB URL...")
-            goto_with_sso_retry(page, direct_url, timeout_ms=args.timeout, headed=args.headed)
-
-        # Wait for content
-        print(f"⏳ Waiting for body text length >= {args.min_chars}")
-        length = wait_for_text_length(page, min_chars=args.min_chars, timeout_ms=args.timeout)
-        print(f"   Observed text length: {length}")
+        attach_debug(page, verbose=args.verbose)
 
-        # Save raw HTML + screenshot (still useful)
-        png_path = out_dir / f"{base}.png"
-        html_path = out_dir / f"{base}.html"
         try:
-            page.screenshot(path=str(png_path), full_page=True)
-            print(f"✅ Screenshot: {png_path}")
-        except Exception as e:
-            print(f"⚠️ Screenshot failed: {e}")
-
-        html = page.content()
-        html_path.write_text(html, encoding="utf-8")
-        print(f"✅ HTML: {html_path}")
-
-        # NEW: Extract main content and write Word file
-        if args.docx:
-            title, main_text = extract_main_text_from_html(html)
-
-            if not main_text or len(main_text) < 200:
-                print("⚠️ Main content extraction produced little text.")
-                print("   Tip: the page may be mostly dynamic; increase --timeout or --min-chars, or share HTML for selector tuning.")
-
-            docx_filename = args.docx_name.strip() or f"{base}.docx"
-            docx_path = out_dir / safe_filename(docx_filename, default=f"{base}.docx")
-            save_to_docx(docx_path, title=title, main_text=main_text, source_url=page.url)
-
-            print(f"✅ Word saved: {docx_path}")
-
-        context.close()
+            for i, url in enumerate(urls):
+                if len(urls) > 1:
+                    print(f"\n[{i + 1}/{len(urls)}] {url}")
+                try:
+                    export_kb(page, url, args, out_dir, first=(i == 0), single=(len(urls) == 1))
+                except RuntimeError:
+                    raise
+                except Exception as e:
+                    if len(urls) == 1:
+                        raise
+                    print(f"❌ {url}: {e}")
+                # Drop the finished page's resource-timing buffer before the next one
+                try:
+                    page.evaluate("() => performance.clearResourceTimings()")
+                except PlaywrightError:
+                    pass
+        finally:
+            context.close()
         print("\nDone.")
 
 
@@ -1,71 +1,58 @@
 #!/usr/bin/env python3
 import argparse
 import base64
+import binascii
+import gc
+import hashlib
 import re
 import shutil
-import time
-import tempfile
 from io import BytesIO
 from pathlib import Path
-from datetime import datetime
-from urllib.parse import unquote, urljoin, urlparse
+from urllib.parse import urljoin, urlparse
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 from playwright._impl._errors import Error as PlaywrightError
 
-from bs4 import BeautifulSoup, Tag, NavigableString
+from kb_common import decode_target_to_direct_url, extract_kb_number, looks_like_login, safe_filename, stamp
+
+from bs4 import BeautifulSoup, CData, Tag, NavigableString
 from docx import Document
 from docx.shared import Inches, Pt
 
+# Optional: selectolax parses/selects ~10x faster than BS4 for container picking
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
 
 DEFAULT_URL = "https://myservice.lloyds.com/now/nav/ui/classic/params/target/kb_view.do%3Fsysparm_article%3DKB0010611"
 
+# Trim subsystems a single-article export never uses (faster launch, less RSS).
+# --single-process/--no-zygote are left out: they crash Chromium under load.
+LAUNCH_ARGS = [
+    "--disable-gpu",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-features=Translate,BackForwardCache,InterestCohort",
+]
+
 
 # -------------------------
 # Utilities
 # -------------------------
 
-def stamp() -> str:
-    return datetime.now().strftime("%Y%m%d_%H%M%S")
-
-
-def safe_filename(name: str, default: str = "page") -> str:
-    name = (name or "").strip() or default
-    name = re.sub(r"[^\w\-\.]+", "_", name)
-    return name[:180]
-
-
-def looks_like_login(url: str) -> bool:
-    u = (url or "").lower()
-    return any(s in u for s in ("login", "sso", "saml", "auth", "okta", "adfs", "signin", "microsoftonline.com"))
-
-
-def extract_kb_number(text: str) -> str | None:
-    m = re.search(r"(KB\d+)", text or "")
-    return m.group(1) if m else None
+_RE_WS = re.compile(r"\s+")
+_RE_DATAIMG = re.compile(r"data:image/([^;]+);base64", re.IGNORECASE)
 
 
-def decode_target_to_direct_url(url: str) -> str:
-    """
-    Converts:
-      .../target/kb_view.do%3Fsysparm_article%3DKB0010611
-    into:
-      https://<host>/kb_view.do?sysparm_article=KB0010611
-    """
-    m = re.search(r"/target/([^?]+)", url)
-    if not m:
-        return url
-    encoded = m.group(1)
-    decoded = unquote(encoded)
-    if decoded.startswith("http://") or decoded.startswith("https://"):
-        return decoded
-    host = re.match(r"^(https?://[^/]+)", url)
-    if not host:
-        return url
-    return f"{host.group(1)}/{decoded.lstrip('/')}"
-
-
-def attach_debug(page):
+def attach_debug(page, verbose: bool = False):
+    # Unregistered listeners mean Playwright never marshals the events at all
+    if not verbose:
+        return
     page.on("console", lambda msg: print(f"[console] {msg.type}: {msg.text}"))
     page.on("pageerror", lambda err: print(f"[pageerror] {err}"))
     page.on("requestfailed", lambda req: print(f"[requestfailed] {req.url} -> {req.failure}"))
@@ -79,21 +66,26 @@ def get_body_text(page) -> str:
 
 
 def wait_for_text_length(page, min_chars: int, timeout_ms: int) -> int:
-    deadline = time.time() + timeout_ms / 1000
-    last_len = 0
-    while time.time() < deadline:
-        txt = get_body_text(page)
-        last_len = len(txt)
-        if last_len >= min_chars:
-            return last_len
-        time.sleep(0.25)
-    return last_len
-
-
-def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attempts: int = 3) -> None:
+    # Predicate is polled inside the browser; one round-trip instead of one per 250ms.
+    # Same 250ms cadence: the default rAF polling would force innerText's layout every frame
+    try:
+        page.wait_for_function(
+            "n => (document.body && document.body.innerText || '').trim().length >= n",
+            arg=min_chars,
+            polling=250,
+            timeout=timeout_ms,
+        )
+    except PlaywrightError:
+        # Timeout, or the context was torn down by a late redirect
+        pass
+    return len(get_body_text(page))
+
+
+def goto_with_sso_retry(page, url: str, timeout_ms: int, headed: bool, max_attempts: int = 3,
+                        wait_until: str = "domcontentloaded") -> None:
     for attempt in range(1, max_attempts + 1):
         try:
-            page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+            page.goto(url, wait_until=wait_until, timeout=timeout_ms)
             return
         except PlaywrightTimeoutError:
             print(f"⚠️ goto timeout (attempt {attempt}/{max_attempts}). Continuing...")
@@ -126,43 +118,102 @@ USELESS_SELECTORS = [
     ".navbar", ".nav", ".navigation", ".header", ".footer",
     ".sidebar", ".side-nav", ".toc", ".breadcrumbs",
 ]
+CANDIDATE_SELECTORS = [
+    "article", "main",
+    "#kb_article", ".kb-article", ".kb-article-content", ".kb-view",
+    ".sn-kb-article", ".knowledge-article",
+    "[id*='kb']", "[class*='kb']",
+    "[class*='article']", "[class*='content']",
+]
+
+# Parse each selector list once and match in a single tree walk
+_USELESS_COMPOUND = ", ".join(sorted(USELESS_TAGS) + USELESS_SELECTORS)
+_CANDIDATE_COMPOUND = ", ".join(CANDIDATE_SELECTORS)
+
+
+# Pick the main container in the page and ship only that subtree (plus the
+# title) instead of the whole serialized DOM; chrome areas are skipped.
+MAIN_HTML_JS = """(cfg) => {
+    const textLen = (n) => (n.innerText || '').trim().length;
+    let best = null, bestLen = 0;
+    const scan = (sel) => {
+        for (const n of document.querySelectorAll(sel)) {
+            if (n.closest(cfg.useless)) continue;
+            const l = textLen(n);
+            if (l > bestLen) { bestLen = l; best = n; }
+        }
+    };
+    scan(cfg.candidates);
+    if (!(best && bestLen >= 400)) scan('div, section, article, main');
+    best = best || document.body;
+    if (!best) return document.documentElement.outerHTML;
+    const d = document.implementation.createHTMLDocument(document.title);
+    d.body.appendChild(d.importNode(best, true));
+    return d.documentElement.outerHTML;
+}"""
+
+
+def page_main_html(page) -> str:
+    """Main-container HTML for extraction; the full page.content() if the in-page pick fails."""
+    try:
+        return page.evaluate(MAIN_HTML_JS, {"candidates": _CANDIDATE_COMPOUND, "useless": _USELESS_COMPOUND})
+    except PlaywrightError:
+        return page.content()
 
 
 def soup_remove_useless(soup: BeautifulSoup) -> None:
-    for t in list(soup.find_all(list(USELESS_TAGS))):
-        t.decompose()
-    for sel in USELESS_SELECTORS:
-        for t in soup.select(sel):
+    # One select over the joined list instead of a tree walk per selector;
+    # matches nested in an already-removed block are skipped
+    for t in soup.select(_USELESS_COMPOUND):
+        if not t.decomposed:
             t.decompose()
 
 
-def pick_best_container(soup: BeautifulSoup) -> Tag:
-    candidate_selectors = [
-        "article", "main",
-        "#kb_article", ".kb-article", ".kb-article-content", ".kb-view",
-        ".sn-kb-article", ".knowledge-article",
-        "[id*='kb']", "[class*='kb']",
-        "[class*='article']", "[class*='content']",
-    ]
+def text_lengths(root) -> dict[int, int]:
+    """
+    len(tag.get_text("\n", strip=True)) for every tag under root, in one pass:
+    walking in reverse document order, a tag's descendants are already summed.
+    """
+    acc: dict[int, list[int]] = {}  # id(tag) -> [chars, non-empty strings]
+    lengths: dict[int, int] = {}
+    for node in reversed(list(root.descendants)):
+        if isinstance(node, Tag):
+            chars, pieces = acc.pop(id(node), (0, 0))
+            lengths[id(node)] = chars + max(pieces - 1, 0)  # "\n" between pieces
+        elif type(node) in (NavigableString, CData):
+            s = node.strip()
+            if not s:
+                continue
+            chars, pieces = len(s), 1
+        else:
+            continue  # comments, doctype, ...
+        a = acc.setdefault(id(node.parent), [0, 0])
+        a[0] += chars
+        a[1] += pieces
+    return lengths
 
+
+def pick_best_container(soup: BeautifulSoup) -> Tag:
+    # Candidate sets overlap heavily; every tag's text length comes from one walk
+    lengths = text_lengths(soup)
     best_node = None
     best_len = 0
 
-    for sel in candidate_selectors:
-        for node in soup.select(sel):
-            txt = node.get_text("\n", strip=True)
-            ln = len(txt)
-            if ln > best_len:
-                best_len = ln
-                best_node = node
+    # One select over the joined list instead of a tree walk per selector
+    for node in soup.select(_CANDIDATE_COMPOUND):
+        ln = lengths[id(node)]
+        if ln > best_len:
+            best_len = ln
+            best_node = node
 
     if best_node and best_len >= 400:
         return best_node
 
     # fallback: largest meaningful block
-    for node in soup.find_all(["div", "section", "article", "main"], recursive=True):
-        txt = node.get_text("\n", strip=True)
-        ln = len(txt)
+    for node in soup.descendants:
+        if not isinstance(node, Tag) or node.name not in ("div", "section", "article", "main"):
+            continue
+        ln = lengths[id(node)]
         if ln > best_len:
             best_len = ln
             best_node = node
@@ -170,11 +221,52 @@ def pick_best_container(soup: BeautifulSoup) -> Tag:
     return best_node if best_node else (soup.body or soup)
 
 
+def _extract_main_container_fast(html: str) -> tuple[str, Tag]:
+    """
+    Same heuristics as the BS4 path, but parse/clean/select in selectolax (C)
+    and only hand the winning subtree to BS4 for the DOCX walker.
+    """
+    tree = HTMLParser(html)
+    title_node = tree.css_first("title")
+    title = title_node.text(strip=True) if title_node else ""
+
+    # Reverse document order: descendants go before their ancestors are freed
+    for t in reversed(tree.css(_USELESS_COMPOUND)):
+        t.decompose()
+
+    best_node = None
+    best_len = 0
+
+    for node in tree.css(_CANDIDATE_COMPOUND):
+        ln = len(node.text(deep=True, separator="\n", strip=True))
+        if ln > best_len:
+            best_len = ln
+            best_node = node
+
+    if not (best_node and best_len >= 400):
+        for node in tree.css("div, section, article, main"):
+            ln = len(node.text(deep=True, separator="\n", strip=True))
+            if ln > best_len:
+                best_len = ln
+                best_node = node
+
+    best_node = best_node or tree.body
+    if best_node is None:
+        soup = BeautifulSoup(html, "lxml")
+        return title, soup.body or soup
+
+    soup = BeautifulSoup(best_node.html, "lxml")
+    return title, soup.body or soup
+
+
 def extract_main_container(html: str) -> tuple[str, Tag]:
     """
     Returns (title, container_tag) where container_tag contains main content (including images).
     Uses BS4 heuristics; optional trafilatura just for sanity but we still keep the DOM for images.
     """
+    if HTMLParser is not None:
+        return _extract_main_container_fast(html)
+
     soup = BeautifulSoup(html, "lxml")
     title = soup.title.get_text(strip=True) if soup.title else ""
     soup_remove_useless(soup)
@@ -186,17 +278,87 @@ def extract_main_container(html: str) -> tuple[str, Tag]:
 # Image downloading (auth-aware)
 # -------------------------
 
+# Icons and logos repeat within an article; keyed by absolute URL, or by a
+# digest for data: URIs. Cleared after every KB so a --urls-file run stays flat,
+# and failures are not stored so a transient 401/5xx is retried next time.
+_IMG_CACHE: dict[str, tuple[bytes, str]] = {}
+
+
+# Image responses Chromium already downloaded while the page loaded, keyed by
+# every URL in their redirect chain; bodies are read only if an <img> needs one
+_IMG_RESPONSES: dict[str, object] = {}
+
+
+def capture_image_responses(page) -> None:
+    """Attach before navigating so the article's images can skip a second download."""
+    def on_response(resp):
+        if resp.request.resource_type != "image" or not resp.ok:
+            return
+        _IMG_RESPONSES[resp.url] = resp
+        req = resp.request.redirected_from
+        while req is not None:
+            _IMG_RESPONSES[req.url] = resp
+            req = req.redirected_from
+
+    page.on("response", on_response)
+
+
+def cached_network_image(full_url: str) -> tuple[bytes, str] | None:
+    if full_url in _IMG_CACHE:
+        return _IMG_CACHE[full_url]
+    resp = _IMG_RESPONSES.pop(full_url, None)
+    if resp is None:
+        return None
+    try:
+        body = resp.body()
+    except Exception:
+        # Body already evicted (e.g. after a later navigation); fetch it again
+        return None
+    _IMG_CACHE[full_url] = (body, guess_ext_from_content_type(resp.headers.get("content-type")))
+    return _IMG_CACHE[full_url]
+
+
 def is_data_image(src: str) -> bool:
     return src.startswith("data:image/")
 
 
-def decode_data_image(src: str) -> tuple[bytes, str]:
+# Tracking pixels and layout spacers; never worth an HTTP round trip
+SPACER_PATHS = ("/spacer.gif", "/1x1.png", "/1x1.gif", "/pixel.gif", "/blank.gif")
+_RE_PX = re.compile(r"\s*(\d+)")
+
+
+def is_decorative_image(img: Tag, src: str, base_url: str) -> bool:
+    """True for <img> tags that can be dropped without fetching anything."""
+    src = src.strip()
+    if not src:
+        return True
+    if img.get("aria-hidden") == "true" or img.get("role") == "presentation":
+        return True
+    for attr in ("width", "height"):
+        m = _RE_PX.match(img.get(attr) or "")
+        if m and int(m.group(1)) <= 2:
+            return True
+    if is_data_image(src):
+        # 0-byte payload: nothing after the comma
+        return src.endswith(",")
+    return urlparse(urljoin(base_url, src)).path.lower().endswith(SPACER_PATHS)
+
+
+def decode_data_image(src: str) -> tuple[bytes | None, str | None]:
     # data:image/png;base64,....
-    header, b64 = src.split(",", 1)
+    comma = src.find(",")
+    if comma < 0:
+        # No payload at all; don't decode the header as base64
+        return None, None
     # try to infer ext
-    m = re.search(r"data:image/([^;]+);base64", header, re.IGNORECASE)
+    m = _RE_DATAIMG.match(src, 0, comma)
     ext = (m.group(1).lower() if m else "png").replace("jpeg", "jpg")
-    return base64.b64decode(b64), ext
+    # Slice once instead of split(",") copying both halves
+    try:
+        return binascii.a2b_base64(src[comma + 1:]), ext
+    except (binascii.Error, ValueError):
+        # Bad padding, or non-ASCII in a percent-decoded / corrupted URI
+        return None, None
 
 
 def guess_ext_from_content_type(ct: str | None) -> str:
@@ -233,8 +395,13 @@ def fetch_image_bytes(page, context, src: str, base_url: str) -> tuple[bytes | N
 
     # 1) data URI
     if is_data_image(src):
-        bts, ext = decode_data_image(src)
-        return bts, ext
+        key = "data:" + hashlib.sha1(src.encode()).hexdigest()
+        if key not in _IMG_CACHE:
+            bts, ext = decode_data_image(src)
+            if not bts:
+                return None, None
+            _IMG_CACHE[key] = (bts, ext)
+        return _IMG_CACHE[key]
 
     # 2) blob URL: must be fetched in the page context
     if src.startswith("blob:"):
@@ -265,35 +432,97 @@ def fetch_image_bytes(page, context, src: str, base_url: str) -> tuple[bytes | N
     if scheme not in ("http", "https"):
         return None, None
 
+    cached = cached_network_image(full_url)
+    if cached is not None:
+        return cached
+
     try:
         resp = context.request.get(full_url, timeout=60_000)
         if not resp.ok:
             return None, None
         ct = resp.headers.get("content-type")
         ext = guess_ext_from_content_type(ct)
-        return resp.body(), ext
+        _IMG_CACHE[full_url] = (resp.body(), ext)
+        return _IMG_CACHE[full_url]
     except Exception:
         return None, None
 
 
+PREFETCH_IMAGES_JS = """async (urls) => {
+    const one = async (u) => {
+        try {
+            const r = await fetch(u, {credentials: 'include'});
+            if (!r.ok) return null;
+            const a = new Uint8Array(await r.arrayBuffer());
+            let s = '';
+            for (let i=0; i<a.length; i++) s += String.fromCharCode(a[i]);
+            return [btoa(s), r.headers.get('content-type')];
+        } catch (e) {
+            return null;
+        }
+    };
+    return Promise.all(urls.map(one));
+}"""
+
+
+def prefetch_images(page, context, srcs, base_url: str) -> dict:
+    """
+    Fetch all unique image srcs up front instead of one RTT per <img>.
+    Sync Playwright objects can't be shared across threads, so the parallel
+    part runs in-page (Promise.all); anything it can't get (CORS, data:,
+    blob:, errors) falls back to fetch_image_bytes one at a time.
+    """
+    results = {}
+    remote = {}
+    for src in dict.fromkeys(srcs):
+        s = (src or "").strip()
+        if not s or is_data_image(s) or s.startswith("blob:"):
+            continue
+        full_url = urljoin(base_url, s)
+        cached = cached_network_image(full_url)
+        if cached is not None:
+            results[src] = cached
+        elif urlparse(full_url).scheme.lower() in ("http", "https"):
+            remote[src] = full_url
+
+    if remote:
+        unique = list(dict.fromkeys(remote.values()))
+        try:
+            fetched = dict(zip(unique, page.evaluate(PREFETCH_IMAGES_JS, unique)))
+        except Exception:
+            fetched = {}
+        for src, full_url in remote.items():
+            item = fetched.get(full_url)
+            if item:
+                b64, ct = item
+                if full_url not in _IMG_CACHE:
+                    _IMG_CACHE[full_url] = (base64.b64decode(b64), guess_ext_from_content_type(ct))
+                results[src] = _IMG_CACHE[full_url]
+
+    for src in srcs:
+        if src not in results:
+            results[src] = fetch_image_bytes(page, context, src, base_url=base_url)
+    return results
+
+
 # -------------------------
 # HTML -> DOCX with images
 # -------------------------
 
 def add_paragraph_text(doc: Document, text: str):
-    text = re.sub(r"\s+", " ", (text or "")).strip()
+    text = _RE_WS.sub(" ", text or "").strip()
     if text:
         doc.add_paragraph(text)
 
 
 def add_heading(doc: Document, text: str, level: int):
-    text = re.sub(r"\s+", " ", (text or "")).strip()
+    text = _RE_WS.sub(" ", text or "").strip()
     if text:
         doc.add_heading(text, level=level)
 
 
 def add_list_item(doc: Document, text: str, ordered: bool):
-    text = re.sub(r"\s+", " ", (text or "")).strip()
+    text = _RE_WS.sub(" ", text or "").strip()
     if not text:
         return
     style = "List Number" if ordered else "List Bullet"
@@ -306,7 +535,12 @@ def container_to_docx(doc: Document, container: Tag, page, context, base_url: st
     Walk through container children in order and add to doc.
     Supports: headings, paragraphs, lists, images.
     """
-    temp_dir = Path(tempfile.mkdtemp(prefix="kb_docx_imgs_"))
+    def img_src(img: Tag) -> str:
+        return img.get("src") or img.get("data-src") or ""
+
+    # All of the container's images in one go; handle_node only looks them up
+    srcs = [img_src(i) for i in container.find_all("img") if not is_decorative_image(i, img_src(i), base_url)]
+    images = prefetch_images(page, context, srcs, base_url)
 
     def handle_node(node: Tag | NavigableString, list_mode: str | None = None):
         if isinstance(node, NavigableString):
@@ -350,9 +584,13 @@ def container_to_docx(doc: Document, container: Tag, page, context, base_url: st
 
         # Image
         if name == "img":
-            src = node.get("src") or node.get("data-src") or ""
+            src = img_src(node)
+            if is_decorative_image(node, src, base_url):
+                return
             alt = node.get("alt") or ""
-            bts, ext = fetch_image_bytes(page, context, src, base_url=base_url)
+            if src not in images:
+                images[src] = fetch_image_bytes(page, context, src, base_url=base_url)
+            bts, ext = images[src]
 
             if not bts:
                 # fallback: try screenshotting the element itself
@@ -367,15 +605,13 @@ def container_to_docx(doc: Document, container: Tag, page, context, base_url: st
                     pass
                 return
 
-            img_path = temp_dir / f"img_{len(list(temp_dir.iterdir())) + 1}.{ext}"
-            img_path.write_bytes(bts)
-
             # Optional caption with alt text
             if alt:
                 doc.add_paragraph(alt)
 
             try:
-                doc.add_picture(str(img_path), width=Inches(max_image_width_in))
+                # Straight from memory; python-docx takes any file-like object
+                doc.add_picture(BytesIO(bts), width=Inches(max_image_width_in))
             except Exception:
                 # if docx can't handle format (e.g., webp), skip with note
                 doc.add_paragraph(f"[Image format not supported in Word: .{ext}]")
@@ -400,11 +636,8 @@ def container_to_docx(doc: Document, container: Tag, page, context, base_url: st
         if isinstance(child, Tag):
             handle_node(child)
 
-    # cleanup temp dir (best effort)
-    try:
-        shutil.rmtree(temp_dir, ignore_errors=True)
-    except Exception:
-        pass
+    # Drop this document's references; main() empties _IMG_CACHE once the KB is saved
+    images.clear()
 
 
 def build_docx(title: str, source_url: str, container: Tag, page, context,
@@ -431,15 +664,86 @@ def build_docx(title: str, source_url: str, container: Tag, page, context,
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
     doc.save(str(output_path))
+    # python-docx's element tree is full of parent links; free it now rather than
+    # letting it pile up across a --urls-file batch
+    del doc
+    gc.collect()
 
 
 # -------------------------
 # Main
 # -------------------------
 
+def read_urls_file(path: Path) -> list[str]:
+    """One URL per line; blank lines and # comments are skipped."""
+    urls = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
+
+
+def export_kb(page, context, url: str, args, out_dir: Path, first: bool, single: bool) -> None:
+    """
+    Navigate to one KB and write its artifacts. Only the first URL goes
+    through the nav wrapper and SSO; later ones reuse the signed-in context.
+    """
+    direct_url = decode_target_to_direct_url(url)
+    kb = extract_kb_number(direct_url) or extract_kb_number(url) or "KB"
+    base_name = safe_filename(args.name if single and args.name.strip() else kb)
+    base = f"{base_name}_{stamp()}"
+
+    docx_path = out_dir / f"{base}.docx"
+    html_path = out_dir / f"{base}.html"
+    jpg_path = out_dir / f"{base}.jpg"
+
+    if first or args.skip_direct:
+        # Open initial URL
+        print("➡️ Opening initial URL...")
+        # The wrapper usually bounces straight to SSO; no point waiting for its DOMContentLoaded
+        goto_with_sso_retry(page, url, timeout_ms=args.timeout, headed=args.headed, wait_until="commit")
+
+        # Manual SSO if needed
+        if looks_like_login(page.url):
+            if not args.headed:
+                raise RuntimeError("SSO requires interaction. Re-run with --headed.")
+            input("✅ Complete SSO in the browser, then press ENTER here...")
+
+    # Navigate to direct KB URL unless skipped
+    if not args.skip_direct:
+        print("➡️ Navigating to direct KB URL...")
+        goto_with_sso_retry(page, direct_url, timeout_ms=args.timeout, headed=args.headed)
+
+    # Wait for content
+    print(f"⏳ Waiting for body text length >= {args.min_chars}")
+    length = wait_for_text_length(page, min_chars=args.min_chars, timeout_ms=args.timeout)
+    print(f"   Observed text length: {length}")
+
+    # Save screenshot + HTML (debug / archive); a full-page capture is the slowest step
+    if args.screenshot:
+        try:
+            page.screenshot(path=str(jpg_path), full_page=True, type="jpeg", quality=70)
+            print(f"✅ Screenshot: {jpg_path}")
+        except Exception as e:
+            print(f"⚠️ Screenshot failed: {e}")
+
+    if not args.no_html:
+        html = page.content()
+        html_path.write_bytes(html.encode("utf-8"))
+        print(f"✅ HTML: {html_path}")
+
+    # Extract main container + build Word doc (with images)
+    title, container = extract_main_container(page_main_html(page))
+    print("💾 Building Word document (with images)...")
+    build_docx(title=title, source_url=page.url, container=container, page=page, context=context, output_path=docx_path)
+    print(f"✅ Word saved: {docx_path}")
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--url", default=DEFAULT_URL)
+    ap.add_argument("--urls-file", default="", help="Text file with one KB URL per line (overrides --url)")
     ap.add_argument("--outdir", default="downloads")
     ap.add_argument("--profile-dir", default="pw_profile")
     ap.add_argument("--relogin", action="store_true")
@@ -448,6 +752,9 @@ def main():
     ap.add_argument("--min-chars", type=int, default=800)
     ap.add_argument("--name", default="")
     ap.add_argument("--skip-direct", action="store_true")
+    ap.add_argument("--screenshot", action="store_true", help="Save a full-page JPEG screenshot (debugging)")
+    ap.add_argument("--no-html", action="store_true", help="Don't archive the full page HTML (skips page.content())")
+    ap.add_argument("--verbose", action="store_true", help="Verbose Playwright console/request logging")
     args = ap.parse_args()
 
     out_dir = Path(args.outdir)
@@ -458,64 +765,46 @@ def main():
         print(f"🧹 Removing profile dir for relogin: {profile_dir}")
         shutil.rmtree(profile_dir, ignore_errors=True)
 
-    direct_url = decode_target_to_direct_url(args.url)
-    kb = extract_kb_number(direct_url) or extract_kb_number(args.url) or "KB"
-    base_name = safe_filename(args.name if args.name.strip() else kb)
-    base = f"{base_name}_{stamp()}"
-
-    docx_path = out_dir / f"{base}.docx"
-    html_path = out_dir / f"{base}.html"
-    png_path = out_dir / f"{base}.png"
+    urls = read_urls_file(Path(args.urls_file)) if args.urls_file else [args.url]
+    if not urls:
+        raise SystemExit(f"No URLs found in {args.urls_file}")
 
+    # One browser and one signed-in page for the whole batch
     with sync_playwright() as p:
         context = p.chromium.launch_persistent_context(
             user_data_dir=str(profile_dir),
             headless=(not args.headed),
             viewport={"width": 1400, "height": 900},
+            args=LAUNCH_ARGS,
+            ignore_default_args=["--enable-automation"],
         )
         page = context.new_page()
         page.set_default_timeout(args.timeout)
-        attach_debug(page)
-
-        # Open initial URL
-        print("➡️ Opening initial URL...")
-        goto_with_sso_retry(page, args.url, timeout_ms=args.timeout, headed=args.headed)
+        attach_debug(page, verbose=args.verbose)
+        capture_image_responses(page)
 
-        # Manual SSO if needed
-        if looks_like_login(page.url):
-            if not args.headed:
-                context.close()
-                raise RuntimeError("SSO requires interaction. Re-run with --headed.")
-            input("✅ Complete SSO in the browser, then press ENTER here...")
-
-        # Navigate to direct KB URL unless skipped
-        if not args.skip_direct:
-            print("➡️ Navigating to direct KB URL...")
-            goto_with_sso_retry(page, direct_url, timeout_ms=args.timeout, headed=args.headed)
-
-        # Wait for content
-        print(f"⏳ Waiting for body text length >= {args.min_chars}")
-        length = wait_for_text_length(page, min_chars=args.min_chars, timeout_ms=args.timeout)
-        print(f"   Observed text length: {length}")
-
-        # Save screenshot + HTML (debug / archive)
         try:
-            page.screenshot(path=str(png_path), full_page=True)
-            print(f"✅ Screenshot: {png_path}")
-        except Exception as e:
-            print(f"⚠️ Screenshot failed: {e}")
-
-        html = page.content()
-        html_path.write_text(html, encoding="utf-8")
-        print(f"✅ HTML: {html_path}")
-
-        # Extract main container + build Word doc (with images)
-        title, container = extract_main_container(html)
-        print("💾 Building Word document (with images)...")
-        build_docx(title=title, source_url=page.url, container=container, page=page, context=context, output_path=docx_path)
-        print(f"✅ Word saved: {docx_path}")
-
-        context.close()
+            for i, url in enumerate(urls):
+                if len(urls) > 1:
+                    print(f"\n[{i + 1}/{len(urls)}] {url}")
+                try:
+                    export_kb(page, context, url, args, out_dir, first=(i == 0), single=(len(urls) == 1))
+                except RuntimeError:
+                    raise
+                except Exception as e:
+                    if len(urls) == 1:
+                        raise
+                    print(f"❌ {url}: {e}")
+                # The previous page's responses can't be read after navigating away,
+                # and its image bytes are already in the saved .docx
+                _IMG_RESPONSES.clear()
+                _IMG_CACHE.clear()
+                try:
+                    page.evaluate("() => performance.clearResourceTimings()")
+                except PlaywrightError:
+                    pass
+        finally:
+            context.close()
         print("\nDone.")
 
 